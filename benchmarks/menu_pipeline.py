@@ -0,0 +1,305 @@
+"""Measures how the menu pipeline scales with the number of devices.
+
+Every size runs in its own process against a virtual volume monitor, with the
+tray icon published on a private dbus-daemon, and reports as JSON:
+
+    python -m benchmarks.menu_pipeline --sizes 1,10,100,500 --output results.json
+
+Each size populates N drives with M volumes, K of which are mounted, then
+measures the initial menu build, the GetLayout reply, and the latency and D-Bus
+signal traffic of scripted signal bursts. The latency of a burst is reported
+twice: `end_to_end` runs from the last signal to `menu-changed` and so includes
+the rebuild debounce, while `rebuild` is the `menu.rebuild` histogram MountMenu
+records for the rebuilds themselves.
+"""
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import gi
+
+gi.require_versions({
+    'Gio': '2.0',
+    'GObject': '2.0',
+    'GdkPixbuf': '2.0',
+    'Dbusmenu': '0.4',
+})
+
+import asyncio
+from collections import Counter
+from gi.repository import GLib, Gio
+from gi.events import GLibEventLoopPolicy
+
+
+_DEFAULT_SIZES = (1, 10, 100, 500)
+
+_OBJECT_PATH = '/SNIMenu'
+
+_SETTLE_SECONDS = 0.2
+
+
+def _milliseconds(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    return {
+        'median_ms': _milliseconds(statistics.median(samples)),
+        'max_ms': _milliseconds(max(samples)),
+        'samples': len(samples),
+    }
+
+
+def _rebuild_histogram(before: dict[str, int], after: dict[str, int]) -> dict:
+    prefix = 'menu.rebuild.'
+    delta = {
+        name.removeprefix(prefix): value - before.get(name, 0)
+        for name, value in after.items() if name.startswith(prefix)
+    }
+    count = delta.pop('count')
+    sum_us = delta.pop('sum_us')
+    return {
+        'mean_ms': round(sum_us / count / 1000, 3) if count else None,
+        'count': count,
+        'buckets': {name: value for name, value in delta.items() if value},
+    }
+
+
+def _wait_for_menu_change(mount_menu) -> asyncio.Future:
+    future = asyncio.get_event_loop().create_future()
+
+    def on_menu_changed(*_):
+        mount_menu.disconnect(handler)
+        if not future.done():
+            future.set_result(time.perf_counter())
+
+    handler = mount_menu.connect('menu-changed', on_menu_changed)
+    return future
+
+
+class _SignalCounter:
+    def __init__(self, connection: Gio.DBusConnection, sender: str) -> None:
+        self.counts = Counter()
+        connection.signal_subscribe(
+            sender,
+            None,
+            None,
+            None,
+            None,
+            Gio.DBusSignalFlags.NONE,
+            self.__on_signal,
+        )
+
+    def take(self) -> dict[str, int]:
+        counts = dict(self.counts)
+        self.counts.clear()
+        return counts
+
+    def __on_signal(self, _connection, _sender, _path, _interface, signal, _parameters) -> None:
+        self.counts[signal] += 1
+
+
+async def _settle() -> None:
+    await asyncio.sleep(_SETTLE_SECONDS)
+
+
+async def _measure_get_layout(client: Gio.DBusConnection, name: str, repeat: int) -> dict:
+    samples = []
+    reply = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        reply = await client.call_asyncio(
+            name,
+            _OBJECT_PATH,
+            'com.canonical.dbusmenu',
+            'GetLayout',
+            GLib.Variant('(iias)', (0, -1, [])),
+            None,
+            Gio.DBusCallFlags.NONE,
+            -1,
+        )
+        samples.append(time.perf_counter() - started)
+    return _summary(samples) | {'bytes': reply.get_size()}
+
+
+async def _rename_storm(monitor, mount_menu, counter: _SignalCounter, bursts: int, burst_size: int) -> dict:
+    volumes = monitor.get_volumes()
+    samples = []
+    counter.take()
+    metrics = mount_menu.metrics
+    for burst in range(bursts):
+        changed = _wait_for_menu_change(mount_menu)
+        for i in range(min(burst_size, len(volumes))):
+            volume = volumes[(burst * burst_size + i) % len(volumes)]
+            volume.name = f'{volume.name.split(" #")[0]} #{burst}'
+            monitor.changed(volume)
+        started = time.perf_counter()
+        samples.append(await changed - started)
+    await _settle()
+    return {
+        'end_to_end': _summary(samples),
+        'rebuild': _rebuild_histogram(metrics, mount_menu.metrics),
+        'dbus_signals': counter.take(),
+    }
+
+
+async def _hotplug(monitor, mount_menu, counter: _SignalCounter, cycles: int, volumes: int, mounts: int) -> dict:
+    from driveicon.virtualdevices import VirtualDrive, VirtualMount, VirtualVolume
+
+    samples = []
+    counter.take()
+    metrics = mount_menu.metrics
+    for cycle in range(cycles):
+        drive = VirtualDrive(f'Hotplug {cycle}', identifier=f'/dev/hotplug{cycle}')
+        for j in range(volumes):
+            volume = VirtualVolume(f'Hotplug {cycle}.{j}', uuid=f'hotplug-{cycle}-{j}')
+            if j < mounts:
+                root = Gio.File.new_for_path(f'/run/driveicon-virtual/hotplug/{cycle}/{j}')
+                volume.set_mount(VirtualMount(volume.name, root, uuid=volume.uuid))
+            drive.add_volume(volume)
+
+        for change in (monitor.connect_drive, monitor.disconnect_drive):
+            changed = _wait_for_menu_change(mount_menu)
+            change(drive)
+            started = time.perf_counter()
+            samples.append(await changed - started)
+    await _settle()
+    return {
+        'end_to_end': _summary(samples),
+        'rebuild': _rebuild_histogram(metrics, mount_menu.metrics),
+        'dbus_signals': counter.take(),
+    }
+
+
+async def _run_size(args: argparse.Namespace) -> dict:
+    # Must come before anything opens the session bus: libdbusmenu always
+    # exports on the default session bus, which this redirects. The tray is
+    # published on that same shared connection, so GetLayout and the signal
+    # counter can address both menu backends by one unique name.
+    test_dbus = Gio.TestDBus.new(Gio.TestDBusFlags.NONE)
+    test_dbus.up()
+    try:
+        from dasbus.connection import SessionMessageBus
+        from driveicon import wrappers
+        from driveicon.dbusmenu import DBusMenuBackend
+        from driveicon.iconresolver import NamedIconResolver
+        from driveicon.mountmenu import MountMenu
+        from driveicon.trayicon import TrayIcon
+        from driveicon.virtualdevices import VirtualVolumeMonitor, populate
+
+        wrappers.wrap_all()
+        bus = SessionMessageBus()
+        client = Gio.DBusConnection.new_for_address_sync(
+            test_dbus.get_bus_address(),
+            Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+            None,
+            None,
+        )
+
+        monitor = VirtualVolumeMonitor()
+        populate(monitor, args.run, args.volumes, args.mounts)
+
+        started = time.perf_counter()
+        mount_menu = MountMenu(
+            volume_monitor=monitor,
+            rebuild_delay_ms=args.rebuild_delay_ms,
+            filesystem_info_ttl=3600,
+        )
+        initial_build = time.perf_counter() - started
+
+        tray_icon = TrayIcon(
+            id='one.markle.DriveIcon.Benchmark',
+            title='Drives',
+            icon=Gio.ThemedIcon(name='drive-removable-media'),
+            action_group=mount_menu.action_group,
+            menu_model=mount_menu.menu,
+            item_is_menu=True,
+            menu_backend=DBusMenuBackend(args.menu_backend),
+            icon_resolver=NamedIconResolver(),
+            bus=bus,
+        )
+        counter = _SignalCounter(client, bus.connection.get_unique_name())
+        await _settle()
+
+        result = {
+            'drives': args.run,
+            'volumes_per_drive': args.volumes,
+            'mounts_per_drive': args.mounts,
+            'initial_build_ms': _milliseconds(initial_build),
+            'get_layout': await _measure_get_layout(client, bus.connection.get_unique_name(), args.repeat),
+            'scenarios': {
+                'rename-storm': await _rename_storm(monitor, mount_menu, counter, args.repeat, args.burst_size),
+                'hotplug': await _hotplug(monitor, mount_menu, counter, args.repeat, args.volumes, args.mounts),
+            },
+            'rebuild_stats': mount_menu.rebuild_stats,
+            'sni_signal_stats': tray_icon.signal_stats,
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        client.close_sync(None)
+        bus.disconnect()
+        return result
+    finally:
+        test_dbus.down()
+
+
+def _run_all(args: argparse.Namespace) -> dict:
+    results = []
+    for size in args.sizes:
+        command = [
+            sys.executable, '-m', 'benchmarks.menu_pipeline',
+            '--run', str(size),
+            '--volumes', str(args.volumes),
+            '--mounts', str(args.mounts),
+            '--repeat', str(args.repeat),
+            '--burst-size', str(args.burst_size),
+            '--rebuild-delay-ms', str(args.rebuild_delay_ms),
+            '--menu-backend', args.menu_backend,
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output))
+        print(f'N={size} done', file=sys.stderr)
+
+    return {
+        'python': platform.python_version(),
+        'pygobject': gi.__version__,
+        'glib': '.'.join(map(str, (GLib.MAJOR_VERSION, GLib.MINOR_VERSION, GLib.MICRO_VERSION))),
+        'menu_backend': args.menu_backend,
+        'results': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=lambda s: [int(n) for n in s.split(',')], default=list(_DEFAULT_SIZES))
+    parser.add_argument('--volumes', type=int, default=2, help='volumes per drive')
+    parser.add_argument('--mounts', type=int, default=1, help='mounted volumes per drive')
+    parser.add_argument('--repeat', type=int, default=10, help='bursts, hotplug cycles and GetLayout calls')
+    parser.add_argument('--burst-size', type=int, default=50, help='volume-changed signals per burst')
+    parser.add_argument('--rebuild-delay-ms', type=int, default=50)
+    parser.add_argument('--menu-backend', choices=['libdbusmenu', 'native'], default='libdbusmenu')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        asyncio.set_event_loop_policy(GLibEventLoopPolicy())
+        result = asyncio.get_event_loop().run_until_complete(_run_size(args))
+        json.dump(result, sys.stdout)
+        return
+
+    report = json.dumps(_run_all(args), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
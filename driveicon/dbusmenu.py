@@ -0,0 +1,357 @@
+from enum import Enum
+
+from gi.repository import GLib, Gio
+from dasbus.connection import MessageBus
+from dasbus.server.interface import dbus_interface, dbus_signal, returns_multiple_arguments
+from dasbus.server.template import InterfaceTemplate
+from dasbus.typing import Str, UInt32, Bool, Int, List, Tuple, Dict, Variant
+
+from .iconresolver import ThemeIconResolver, NamedIconResolver
+from .menuexport import (
+    DBusMenuEvent,
+    DBusMenuItemProperty,
+    DBusMenuItemType,
+    IconCache,
+    MenuModelExporter,
+)
+from .pixmap import PixmapCache
+from .scheduler import CoalescingScheduler
+
+
+class DBusMenuBackend(Enum):
+    LIBDBUSMENU = 'libdbusmenu'
+    NATIVE = 'native'
+
+
+_VARIANT_BOOL_FALSE = GLib.Variant.new_boolean(False)
+_VARIANT_CHILDREN_DISPLAY_SUBMENU = GLib.Variant.new_string('submenu')
+
+_LAYOUT_SIGNATURE = '(ia{sv}av)'
+
+
+class _NativeMenuItem:
+    __slots__ = ('id', 'properties', 'children', 'action', 'target')
+
+    def __init__(self, id: int) -> None:
+        self.id = id
+        self.properties: dict[str, GLib.Variant] = {}
+        self.children: list[_NativeMenuItem] = []
+        self.action: str | None = None
+        self.target: GLib.Variant | None = None
+
+
+@dbus_interface('com.canonical.dbusmenu')
+class _DBusMenuInterface(InterfaceTemplate):
+    @property
+    def Version(self) -> UInt32:
+        return 3
+
+    @property
+    def TextDirection(self) -> Str:
+        return 'ltr'
+
+    @property
+    def Status(self) -> Str:
+        return 'normal'
+
+    @property
+    def IconThemePath(self) -> List[Str]:
+        return []
+
+    @returns_multiple_arguments
+    def GetLayout(
+            self,
+            parent_id: Int,
+            recursion_depth: Int,
+            property_names: List[Str],
+    ) -> Tuple[UInt32, Tuple[Int, Dict[Str, Variant], List[Variant]]]:
+        return self.implementation.get_layout(parent_id, recursion_depth, property_names)
+
+    def GetGroupProperties(
+            self,
+            ids: List[Int],
+            property_names: List[Str],
+    ) -> List[Tuple[Int, Dict[Str, Variant]]]:
+        return self.implementation.get_group_properties(ids, property_names)
+
+    def GetProperty(self, id: Int, name: Str) -> Variant:
+        return self.implementation.get_property(id, name)
+
+    def Event(self, id: Int, event_id: Str, data: Variant, timestamp: UInt32) -> None:
+        self.implementation.handle_event(id, event_id)
+
+    def EventGroup(self, events: List[Tuple[Int, Str, Variant, UInt32]]) -> List[Int]:
+        return [id for id, event_id, *_ in events if not self.implementation.handle_event(id, event_id)]
+
+    def AboutToShow(self, id: Int) -> Bool:
+        return False
+
+    @returns_multiple_arguments
+    def AboutToShowGroup(self, ids: List[Int]) -> Tuple[List[Int], List[Int]]:
+        return [], [id for id in ids if not self.implementation.has_item(id)]
+
+    @dbus_signal
+    def ItemsPropertiesUpdated(
+            self,
+            updated_props: List[Tuple[Int, Dict[Str, Variant]]],
+            removed_props: List[Tuple[Int, List[Str]]],
+    ) -> None:
+        pass
+
+    @dbus_signal
+    def LayoutUpdated(self, revision: UInt32, parent: Int) -> None:
+        pass
+
+    @dbus_signal
+    def ItemActivationRequested(self, id: Int, timestamp: UInt32) -> None:
+        pass
+
+
+class _NativeDBusMenuProxy(MenuModelExporter[_NativeMenuItem]):
+    def __init__(
+            self,
+            bus: MessageBus,
+            object_path: str,
+            root_menu: Gio.MenuModel,
+            action_group: Gio.ActionGroup,
+            pixmap_cache: PixmapCache,
+            icon_resolver: ThemeIconResolver | NamedIconResolver,
+    ) -> None:
+        super().__init__(action_group)
+        self.__root_menu = root_menu
+        self.__root_item = _NativeMenuItem(0)
+        self.__items: dict[int, _NativeMenuItem] = {0: self.__root_item}
+        self.__next_id = 1
+        self.__revision = 0
+        self.__dirty_containers: dict[int, Gio.MenuModel] = {}
+        self.__spliced_containers: dict[int, None] = {}
+        self.__updated_properties: dict[int, dict[str, GLib.Variant]] = {}
+        self.__removed_properties: dict[int, set[str]] = {}
+        self.__signal_scheduler = CoalescingScheduler(self.__flush, delay_ms=0)
+        self.__icon_cache = IconCache(icon_resolver, pixmap_cache)
+        self.__items_created = 0
+        self.__items_destroyed = 0
+        self.__interface = _DBusMenuInterface(self)
+
+        self.__rebuild_container(self.__root_item, self.__root_menu)
+        bus.publish_object(object_path, self.__interface)
+
+    @property
+    def icon_cache_stats(self) -> dict[str, int]:
+        return self.__icon_cache.stats
+
+    @property
+    def item_stats(self) -> dict[str, int]:
+        return {'created': self.__items_created, 'destroyed': self.__items_destroyed}
+
+    def has_item(self, id: int) -> bool:
+        return id in self.__items
+
+    def get_layout(
+            self,
+            parent_id: int,
+            recursion_depth: int,
+            property_names: list[str],
+    ) -> tuple[int, tuple[int, dict[str, GLib.Variant], list[GLib.Variant]]]:
+        return self.__revision, self.__layout(self.__item(parent_id), recursion_depth, property_names)
+
+    def get_group_properties(
+            self,
+            ids: list[int],
+            property_names: list[str],
+    ) -> list[tuple[int, dict[str, GLib.Variant]]]:
+        items = self.__items.values() if not ids else filter(None, map(self.__items.get, ids))
+        return [(item.id, self.__filter_properties(item, property_names)) for item in items]
+
+    def get_property(self, id: int, name: str) -> GLib.Variant:
+        item = self.__item(id)
+        if name not in item.properties:
+            raise KeyError(f'menu item {id} has no property {name}')
+        return item.properties[name]
+
+    def handle_event(self, id: int, event_id: str) -> bool:
+        if (item := self.__items.get(id)) is None:
+            return False
+
+        if event_id == DBusMenuEvent.CLICKED and item.action is not None:
+            self._action_group.activate_action(item.action, item.target)
+        return True
+
+    def __item(self, id: int) -> _NativeMenuItem:
+        if (item := self.__items.get(id)) is None:
+            raise KeyError(f'unknown menu item {id}')
+        return item
+
+    def __layout(
+            self,
+            item: _NativeMenuItem,
+            depth: int,
+            property_names: list[str],
+    ) -> tuple[int, dict[str, GLib.Variant], list[GLib.Variant]]:
+        children = []
+        if depth != 0:
+            children = [
+                GLib.Variant(_LAYOUT_SIGNATURE, self.__layout(child, depth - 1, property_names))
+                for child in item.children
+            ]
+        return item.id, self.__filter_properties(item, property_names), children
+
+    @staticmethod
+    def __filter_properties(item: _NativeMenuItem, property_names: list[str]) -> dict[str, GLib.Variant]:
+        if not property_names:
+            return dict(item.properties)
+        return {name: item.properties[name] for name in property_names if name in item.properties}
+
+    def __new_item(self) -> _NativeMenuItem:
+        item = _NativeMenuItem(self.__next_id)
+        self.__next_id += 1
+        self.__items_created += 1
+        self.__items[item.id] = item
+        return item
+
+    def __set_property(self, item: _NativeMenuItem, name: str, value: GLib.Variant | None) -> None:
+        if value is None:
+            if item.properties.pop(name, None) is None:
+                return
+            self.__updated_properties.get(item.id, {}).pop(name, None)
+            self.__removed_properties.setdefault(item.id, set()).add(name)
+        else:
+            if item.properties.get(name) == value:
+                return
+            item.properties[name] = value
+            self.__removed_properties.get(item.id, set()).discard(name)
+            self.__updated_properties.setdefault(item.id, {})[name] = value
+        self.__signal_scheduler.schedule()
+
+    def _build_item(
+            self,
+            attrs: Gio.MenuAttributeIter,
+            submenu: Gio.MenuModel | None = None,
+            is_section_header = False,
+    ) -> _NativeMenuItem:
+        item = self.__new_item()
+        action = None
+
+        for name, value in attrs:
+            match name:
+                case Gio.MENU_ATTRIBUTE_TARGET:
+                    item.target = value
+                case Gio.MENU_ATTRIBUTE_ACTION:
+                    action = value.get_string()
+                case Gio.MENU_ATTRIBUTE_LABEL:
+                    item.properties[DBusMenuItemProperty.LABEL] = value
+                case Gio.MENU_ATTRIBUTE_ICON:
+                    match self.__icon_cache.lookup(value):
+                        case (DBusMenuItemProperty.ICON_NAME, icon_name):
+                            item.properties[DBusMenuItemProperty.ICON_NAME] = GLib.Variant.new_string(icon_name)
+                        case (DBusMenuItemProperty.ICON_DATA, icon_data):
+                            item.properties[DBusMenuItemProperty.ICON_DATA] = GLib.Variant('ay', icon_data)
+
+        if is_section_header:
+            item.properties[DBusMenuItemProperty.ENABLED] = _VARIANT_BOOL_FALSE
+            return item
+
+        if action is not None:
+            item.action = action
+            enabled, toggle = self._bind_action(item, action, item.target)
+            if not enabled:
+                item.properties[DBusMenuItemProperty.ENABLED] = _VARIANT_BOOL_FALSE
+            if toggle is not None:
+                toggle_type, toggle_state = toggle
+                item.properties[DBusMenuItemProperty.TOGGLE_TYPE] = GLib.Variant.new_string(toggle_type)
+                item.properties[DBusMenuItemProperty.TOGGLE_STATE] = GLib.Variant.new_int32(toggle_state)
+
+        if submenu is not None and self.__populate(item, submenu):
+            item.properties[DBusMenuItemProperty.CHILDREN_DISPLAY] = _VARIANT_CHILDREN_DISPLAY_SUBMENU
+
+        return item
+
+    def _build_separator(self) -> _NativeMenuItem:
+        item = self.__new_item()
+        item.properties[DBusMenuItemProperty.TYPE] = GLib.Variant.new_string(DBusMenuItemType.SEPARATOR)
+        return item
+
+    def _remove_children(self, container: _NativeMenuItem, offset: int, items: list[_NativeMenuItem]) -> None:
+        for item in items:
+            self.__release_item(item)
+        del container.children[offset:offset + len(items)]
+
+    def _insert_children(self, container: _NativeMenuItem, offset: int, items: list[_NativeMenuItem]) -> None:
+        container.children[offset:offset] = items
+
+    def _set_enabled(self, item: _NativeMenuItem, enabled: bool) -> None:
+        self.__set_property(item, DBusMenuItemProperty.ENABLED, None if enabled else _VARIANT_BOOL_FALSE)
+
+    def _set_toggle_state(self, item: _NativeMenuItem, state: int) -> None:
+        self.__set_property(item, DBusMenuItemProperty.TOGGLE_STATE, GLib.Variant.new_int32(state))
+
+    def __populate(self, container: _NativeMenuItem, menu: Gio.MenuModel) -> bool:
+        container.children = self._build_children(container, menu)
+        return len(container.children) > 0
+
+    def __rebuild_container(self, container: _NativeMenuItem, menu: Gio.MenuModel) -> None:
+        self._release_models(container)
+        for child in container.children:
+            self.__release_item(child)
+
+        self.__update_children_display(container, self.__populate(container, menu))
+
+    def __update_children_display(self, container: _NativeMenuItem, has_children: bool) -> None:
+        if container is not self.__root_item:
+            self.__set_property(
+                container,
+                DBusMenuItemProperty.CHILDREN_DISPLAY,
+                _VARIANT_CHILDREN_DISPLAY_SUBMENU if has_children else None,
+            )
+
+    def __release_item(self, item: _NativeMenuItem) -> None:
+        self.__items_destroyed += 1
+        del self.__items[item.id]
+        self.__updated_properties.pop(item.id, None)
+        self.__removed_properties.pop(item.id, None)
+        self.__dirty_containers.pop(item.id, None)
+        self.__spliced_containers.pop(item.id, None)
+
+        self._forget_item(item)
+        for child in item.children:
+            self.__release_item(child)
+
+    def _on_items_changed(
+            self,
+            menu: Gio.MenuModel,
+            container: _NativeMenuItem,
+            container_menu: Gio.MenuModel,
+            position: int,
+            removed: int,
+            added: int,
+    ) -> None:
+        if container.id not in self.__dirty_containers and self._splice(menu, position, removed, added):
+            self.__update_children_display(container, len(container.children) > 0)
+            self.__spliced_containers[container.id] = None
+        else:
+            self.__dirty_containers[container.id] = container_menu
+        self.__signal_scheduler.schedule()
+
+    def __flush(self, _) -> None:
+        layout_parent = None
+        while self.__dirty_containers:
+            id, menu = self.__dirty_containers.popitem()
+            if id in self.__items:
+                self.__rebuild_container(self.__items[id], menu)
+                layout_parent = id if layout_parent in (None, id) else 0
+
+        for id in self.__spliced_containers:
+            if id in self.__items:
+                layout_parent = id if layout_parent in (None, id) else 0
+        self.__spliced_containers.clear()
+
+        if layout_parent is not None:
+            self.__revision += 1
+            self.__interface.LayoutUpdated.emit(self.__revision, layout_parent)
+
+        updated = [(id, properties) for id, properties in self.__updated_properties.items() if properties]
+        removed = [(id, list(names)) for id, names in self.__removed_properties.items() if names]
+        self.__updated_properties.clear()
+        self.__removed_properties.clear()
+        if updated or removed:
+            self.__interface.ItemsPropertiesUpdated.emit(updated, removed)
@@ -0,0 +1,34 @@
+import asyncio
+from functools import partial
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+
+_T = TypeVar('_T')
+
+
+class DeviceOperationQueue:
+    """Runs operations on the same device one after another.
+
+    Operations submitted under different keys run concurrently; operations under
+    one key start only once every earlier one for that key has finished, whatever
+    its outcome.
+    """
+
+    def __init__(self) -> None:
+        self.__tails: dict[Hashable, asyncio.Future] = {}
+
+    def submit(self, key: Hashable, operation: Callable[[], Awaitable[_T]]) -> asyncio.Future[_T]:
+        task = asyncio.ensure_future(self.__run(self.__tails.get(key), operation))
+        self.__tails[key] = task
+        task.add_done_callback(partial(self.__on_done, key))
+        return task
+
+    @staticmethod
+    async def __run(previous: asyncio.Future | None, operation: Callable[[], Awaitable[_T]]) -> _T:
+        if previous is not None:
+            await asyncio.wait([previous])
+        return await operation()
+
+    def __on_done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self.__tails.get(key) is task:
+            del self.__tails[key]
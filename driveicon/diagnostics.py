@@ -0,0 +1,113 @@
+import cProfile
+import gc
+import io
+import os
+import pstats
+import signal
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from gi.repository import GLib
+
+
+_TOP_ENTRIES = 30
+
+
+def default_dump_directory() -> str:
+    return os.path.join(GLib.get_user_state_dir(), 'driveicon', 'diagnostics')
+
+
+def _type_histogram() -> list[tuple[str, int]]:
+    counts = Counter(f'{type(obj).__module__}.{type(obj).__qualname__}' for obj in gc.get_objects())
+    return counts.most_common(_TOP_ENTRIES)
+
+
+class SignalDiagnostics:
+    """Takes profiles and memory snapshots of the running process on request.
+
+    SIGUSR1 starts a cProfile window of `profile_seconds`; a second SIGUSR1
+    ends it early. SIGUSR2 takes a tracemalloc snapshot, starting tracemalloc
+    on first use, and compares it with the previous one. Both are handled on
+    the GLib main loop and written to `directory` as raw data plus a text
+    summary.
+    """
+
+    def __init__(self, *, profile_seconds = 30, directory: str | None = None) -> None:
+        self.__profile_seconds = profile_seconds
+        self.__directory = directory or default_dump_directory()
+        self.__profiler: cProfile.Profile | None = None
+        self.__profile_source: int | None = None
+        self.__previous_snapshot: tracemalloc.Snapshot | None = None
+
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, self.__on_profile_requested)
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR2, self.__on_memory_snapshot_requested)
+
+    def __on_profile_requested(self) -> bool:
+        if self.__profiler is None:
+            self.__profiler = cProfile.Profile()
+            self.__profile_source = GLib.timeout_add_seconds(self.__profile_seconds, self.__on_profile_timeout)
+            self.__profiler.enable()
+        else:
+            GLib.source_remove(self.__profile_source)
+            self.__finish_profile()
+        return GLib.SOURCE_CONTINUE
+
+    def __on_profile_timeout(self) -> bool:
+        self.__finish_profile()
+        return GLib.SOURCE_REMOVE
+
+    def __finish_profile(self) -> None:
+        profiler, self.__profiler, self.__profile_source = self.__profiler, None, None
+        profiler.disable()
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(_TOP_ENTRIES)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(_TOP_ENTRIES)
+
+        # An exception would remove the GLib signal source and restore the
+        # default action, so the next signal would kill the process.
+        try:
+            base = self.__dump_path('profile')
+            profiler.dump_stats(f'{base}.prof')
+            self.__write_summary(f'{base}.txt', summary.getvalue())
+        except OSError as e:
+            print(f'driveicon: could not write profile: {e}', file=sys.stderr)
+
+    def __on_memory_snapshot_requested(self) -> bool:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f'traced: {current} bytes, peak: {peak} bytes', '', 'Top allocators:']
+        lines += map(str, snapshot.statistics('lineno')[:_TOP_ENTRIES])
+        if self.__previous_snapshot is not None:
+            lines += ['', 'Growth since the previous snapshot:']
+            lines += map(str, snapshot.compare_to(self.__previous_snapshot, 'lineno')[:_TOP_ENTRIES])
+        lines += ['', 'Live objects by type:']
+        lines += (f'{count:>10}  {name}' for name, count in _type_histogram())
+
+        try:
+            base = self.__dump_path('memory')
+            snapshot.dump(f'{base}.snapshot')
+            self.__write_summary(f'{base}.txt', '\n'.join(lines) + '\n')
+        except OSError as e:
+            print(f'driveicon: could not write memory snapshot: {e}', file=sys.stderr)
+
+        self.__previous_snapshot = snapshot
+        return GLib.SOURCE_CONTINUE
+
+    def __dump_path(self, kind: str) -> str:
+        os.makedirs(self.__directory, exist_ok=True)
+        return os.path.join(self.__directory, f'{kind}-{os.getpid()}-{time.strftime("%Y%m%d-%H%M%S")}')
+
+    @staticmethod
+    def __write_summary(path: str, contents: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(contents)
+        print(f'driveicon: wrote {path}', file=sys.stderr)
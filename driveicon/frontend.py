@@ -0,0 +1,59 @@
+from typing import Callable, NamedTuple
+
+from gi.repository import Gio
+
+from .iconresolver import ThemeIconResolver, NamedIconResolver
+
+
+_INTERFACE_SCHEMA = 'org.gnome.desktop.interface'
+
+_DEFAULT_ICON_THEME = 'hicolor'
+
+
+class Frontend(NamedTuple):
+    mount_operation: Gio.MountOperation
+    launch_context: Callable[[], Gio.AppLaunchContext]
+    icon_resolver: ThemeIconResolver | NamedIconResolver
+
+
+def gtk_frontend(application: Gio.Application) -> Frontend:
+    from gi.repository import Gtk, Gdk
+
+    def launch_context():
+        context = Gdk.Display.get_default().get_app_launch_context()
+        context.set_timestamp(Gdk.CURRENT_TIME)
+        return context
+
+    settings = Gtk.Settings.get_default()
+    icon_resolver = ThemeIconResolver(settings.props.gtk_icon_theme_name or _DEFAULT_ICON_THEME)
+    settings.connect(
+        'notify::gtk-icon-theme-name',
+        lambda *_: icon_resolver.set_theme(settings.props.gtk_icon_theme_name or _DEFAULT_ICON_THEME),
+    )
+
+    # Never shown: it parents the mount dialogs and keeps the application running.
+    window = Gtk.ApplicationWindow(application=application)
+    return Frontend(Gtk.MountOperation(parent=window), launch_context, icon_resolver)
+
+
+def headless_frontend(application: Gio.Application) -> Frontend:
+    """Builds a frontend that never loads Gtk or opens a display connection.
+
+    Mount operations that need to ask for a password or a choice are reported
+    as unhandled instead of showing a dialog.
+    """
+    application.hold()
+
+    schema_source = Gio.SettingsSchemaSource.get_default()
+    if schema_source is None or schema_source.lookup(_INTERFACE_SCHEMA, True) is None:
+        icon_resolver = ThemeIconResolver(_DEFAULT_ICON_THEME)
+    else:
+        settings = Gio.Settings(schema_id=_INTERFACE_SCHEMA)
+        icon_resolver = ThemeIconResolver(settings.get_string('icon-theme') or _DEFAULT_ICON_THEME)
+        settings.connect(
+            'changed::icon-theme',
+            lambda *_: icon_resolver.set_theme(settings.get_string('icon-theme') or _DEFAULT_ICON_THEME),
+        )
+        application.interface_settings = settings
+
+    return Frontend(Gio.MountOperation(), Gio.AppLaunchContext, icon_resolver)
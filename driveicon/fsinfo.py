@@ -0,0 +1,126 @@
+import asyncio
+import time
+from functools import partial
+from typing import Callable, Hashable, Iterable, NamedTuple
+
+from gi.repository import GLib, Gio
+
+
+_FILESYSTEM_ATTRIBUTES = ','.join([
+    Gio.FILE_ATTRIBUTE_FILESYSTEM_SIZE,
+    Gio.FILE_ATTRIBUTE_FILESYSTEM_FREE,
+])
+
+
+class FilesystemUsage(NamedTuple):
+    size: int
+    free: int
+
+    @property
+    def used(self) -> int:
+        return max(self.size - self.free, 0)
+
+    def describe(self) -> str:
+        return f'{GLib.format_size(self.free)} free of {GLib.format_size(self.size)}'
+
+
+class _CacheEntry:
+    __slots__ = ('location', 'usage', 'fetched')
+
+    def __init__(self, location: Gio.File) -> None:
+        self.location = location
+        self.usage: FilesystemUsage | None = None
+        self.fetched: float | None = None
+
+
+class FilesystemInfoCache:
+    """Serves filesystem size and free space without waiting for the filesystem.
+
+    `lookup` returns whatever is cached, however old, and queues a refresh in the
+    background once the value is older than `ttl` seconds. At most `concurrency`
+    queries run at once and each is abandoned after `timeout` seconds, so a hung
+    network mount only ever delays its own value. `callback` receives the key of
+    every entry whose value changed.
+    """
+
+    def __init__(
+            self,
+            callback: Callable[[Hashable], None],
+            *,
+            ttl: float = 30,
+            concurrency = 2,
+            timeout: float | None = 10,
+    ) -> None:
+        self.__callback = callback
+        self.__ttl = ttl
+        self.__timeout = timeout
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__entries: dict[Hashable, _CacheEntry] = {}
+        self.__refreshing: dict[Hashable, asyncio.Task] = {}
+        self.__refresh_source: int | None = None
+
+    def lookup(self, key: Hashable, location: Gio.File) -> FilesystemUsage | None:
+        entry = self.__entries.get(key)
+        if entry is None or not entry.location.equal(location):
+            if (task := self.__refreshing.pop(key, None)) is not None:
+                task.cancel()
+            entry = self.__entries[key] = _CacheEntry(location)
+
+        if self.__stale(entry):
+            self.__refresh(key)
+        if self.__refresh_source is None:
+            self.__refresh_source = GLib.timeout_add_seconds(max(int(self.__ttl), 1), self.__on_refresh_timeout)
+        return entry.usage
+
+    def retain(self, keys: Iterable[Hashable]) -> None:
+        for key in self.__entries.keys() - set(keys):
+            del self.__entries[key]
+            if (task := self.__refreshing.pop(key, None)) is not None:
+                task.cancel()
+
+        if not self.__entries and self.__refresh_source is not None:
+            GLib.source_remove(self.__refresh_source)
+            self.__refresh_source = None
+
+    def __stale(self, entry: _CacheEntry) -> bool:
+        return entry.fetched is None or time.monotonic() - entry.fetched >= self.__ttl
+
+    def __refresh(self, key: Hashable) -> None:
+        if key in self.__refreshing:
+            return
+
+        task = asyncio.ensure_future(self.__query(self.__entries[key]))
+        self.__refreshing[key] = task
+        task.add_done_callback(partial(self.__on_query_done, key))
+
+    async def __query(self, entry: _CacheEntry) -> FilesystemUsage:
+        async with self.__semaphore:
+            info = await entry.location.query_filesystem_info_asyncio(
+                _FILESYSTEM_ATTRIBUTES,
+                timeout=self.__timeout,
+            )
+        return FilesystemUsage(
+            info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_FILESYSTEM_SIZE),
+            info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_FILESYSTEM_FREE),
+        )
+
+    def __on_query_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self.__refreshing.get(key) is task:
+            del self.__refreshing[key]
+        if task.cancelled() or (entry := self.__entries.get(key)) is None:
+            return
+
+        entry.fetched = time.monotonic()
+        if task.exception() is not None:
+            return
+
+        usage = task.result()
+        if usage != entry.usage:
+            entry.usage = usage
+            self.__callback(key)
+
+    def __on_refresh_timeout(self) -> bool:
+        for key, entry in self.__entries.items():
+            if self.__stale(entry):
+                self.__refresh(key)
+        return GLib.SOURCE_CONTINUE
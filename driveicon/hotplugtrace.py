@@ -0,0 +1,288 @@
+"""Records the volume monitor signals MountMenu sees and replays them offline.
+
+A trace is a JSON-lines file. The first line holds the device state when
+recording started; every following line is one signal with its time offset and
+snapshots of the devices MountMenu reads while handling it.
+
+    driveicon --record-trace=hub.jsonl
+    python -m driveicon.hotplugtrace hub.jsonl [--fast | --speed FACTOR]
+"""
+
+import asyncio
+import json
+import time
+from typing import TextIO
+
+from gi.repository import Gio
+
+from .mountmenu import _device_identity
+from .virtualdevices import VirtualDrive, VirtualMount, VirtualVolume, VirtualVolumeMonitor
+
+
+_TRACE_VERSION = 1
+
+_SIGNALS = (
+    'drive-changed',
+    'drive-connected',
+    'drive-disconnected',
+    'mount-added',
+    'mount-changed',
+    'mount-removed',
+    'volume-added',
+    'volume-changed',
+    'volume-removed',
+)
+
+_Device = Gio.Drive | Gio.Volume | Gio.Mount
+
+
+def _icon_string(icon: Gio.Icon | None) -> str | None:
+    return icon.to_string() if icon is not None else None
+
+
+class TraceRecorder:
+    def __init__(self, volume_monitor: Gio.VolumeMonitor, file: TextIO) -> None:
+        self.__volume_monitor = volume_monitor
+        self.__file = file
+        self.__started = time.monotonic()
+
+        devices = [
+            *volume_monitor.get_connected_drives(),
+            *volume_monitor.get_volumes(),
+            *volume_monitor.get_mounts(),
+        ]
+        self.__write({'version': _TRACE_VERSION, 'devices': [self.__snapshot(device) for device in devices]})
+        self.__handlers = [
+            volume_monitor.connect(signal_name, self.__on_signal, signal_name)
+            for signal_name in _SIGNALS
+        ]
+
+    def stop(self) -> None:
+        for handler in self.__handlers:
+            self.__volume_monitor.disconnect(handler)
+        self.__handlers = []
+        self.__file.close()
+
+    def __on_signal(self, _, device: _Device, signal_name: str) -> None:
+        self.__write({
+            'time': time.monotonic() - self.__started,
+            'signal': signal_name,
+            'device': self.__key(device),
+            'devices': [self.__snapshot(related) for related in self.__related(device)],
+        })
+
+    def __write(self, record: dict) -> None:
+        self.__file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.__file.flush()
+
+    @staticmethod
+    def __key(device: _Device | None) -> str | None:
+        return _device_identity(device) if device is not None else None
+
+    @staticmethod
+    def __related(device: _Device) -> list[_Device]:
+        match device:
+            case Gio.Drive():
+                volumes = device.get_volumes()
+                mounts = [mount for volume in volumes if (mount := volume.get_mount()) is not None]
+                return [device, *volumes, *mounts]
+            case Gio.Volume():
+                return [related for related in (device.get_drive(), device, device.get_mount()) if related is not None]
+            case _:
+                return [related for related in (device.get_drive(), device.get_volume(), device) if related is not None]
+
+    def __snapshot(self, device: _Device) -> dict:
+        snapshot = {
+            'key': self.__key(device),
+            'name': device.get_name(),
+            'icon': _icon_string(device.get_icon()),
+            'can_eject': device.can_eject(),
+        }
+        match device:
+            case Gio.Drive():
+                return snapshot | {
+                    'kind': 'drive',
+                    'identifier': device.get_identifier(Gio.DRIVE_IDENTIFIER_KIND_UNIX_DEVICE),
+                    'is_removable': device.is_removable(),
+                    'volumes': [self.__key(volume) for volume in device.get_volumes()],
+                }
+            case Gio.Volume():
+                return snapshot | {
+                    'kind': 'volume',
+                    'uuid': device.get_uuid(),
+                    'identifier': device.get_identifier(Gio.VOLUME_IDENTIFIER_KIND_UNIX_DEVICE),
+                    'can_mount': device.can_mount(),
+                    'drive': self.__key(device.get_drive()),
+                    'mount': self.__key(device.get_mount()),
+                }
+            case _:
+                return snapshot | {
+                    'kind': 'mount',
+                    'uuid': device.get_uuid(),
+                    'root': device.get_root().get_uri(),
+                    'can_unmount': device.can_unmount(),
+                    'is_shadowed': device.is_shadowed(),
+                    'volume': self.__key(device.get_volume()),
+                }
+
+
+class TraceReplayer:
+    """Rebuilds a recorded trace on a `VirtualVolumeMonitor`, signal by signal."""
+
+    def __init__(self, file: TextIO) -> None:
+        header, *events = map(json.loads, filter(str.strip, file))
+        if header.get('version') != _TRACE_VERSION:
+            raise ValueError(f'unsupported trace version {header.get("version")!r}')
+
+        self.__events = events
+        self.__devices: dict[str, VirtualDrive | VirtualVolume | VirtualMount] = {}
+        self.__monitor = VirtualVolumeMonitor()
+
+        self.__apply(header['devices'])
+        for device in self.__devices.values():
+            match device:
+                case VirtualDrive():
+                    self.__monitor.drives.append(device)
+                case VirtualVolume() if device.drive is None:
+                    self.__monitor.standalone_volumes.append(device)
+                case VirtualMount() if device.volume is None:
+                    self.__monitor.standalone_mounts.append(device)
+
+    @property
+    def volume_monitor(self) -> VirtualVolumeMonitor:
+        return self.__monitor
+
+    @property
+    def events(self) -> int:
+        return len(self.__events)
+
+    async def play(self, speed: float | None = 1) -> None:
+        """Replays every event, scaling the recorded gaps by 1/`speed`.
+
+        With a `speed` of None events follow each other as fast as possible,
+        yielding to the main loop in between so debounced work still runs.
+        """
+        started = time.monotonic()
+        for event in self.__events:
+            if speed is not None:
+                await asyncio.sleep(max(event['time'] / speed - (time.monotonic() - started), 0))
+            else:
+                await asyncio.sleep(0)
+            self.__replay(event)
+
+    def __replay(self, event: dict) -> None:
+        self.__apply(event['devices'])
+        device = self.__devices[event['device']]
+        monitor = self.__monitor
+
+        match event['signal']:
+            case 'drive-connected' if device not in monitor.drives:
+                monitor.drives.append(device)
+            case 'drive-disconnected' if device in monitor.drives:
+                monitor.drives.remove(device)
+            case 'volume-added' if device.drive is None and device not in monitor.standalone_volumes:
+                monitor.standalone_volumes.append(device)
+            case 'volume-removed':
+                if device in monitor.standalone_volumes:
+                    monitor.standalone_volumes.remove(device)
+                elif device.drive is not None and device in device.drive.volumes:
+                    device.drive.volumes.remove(device)
+            case 'mount-added' if device.volume is None and device not in monitor.standalone_mounts:
+                monitor.standalone_mounts.append(device)
+            case 'mount-removed':
+                if device in monitor.standalone_mounts:
+                    monitor.standalone_mounts.remove(device)
+                elif device.volume is not None and device.volume.mount is device:
+                    device.volume.mount = None
+
+        monitor.emit(event['signal'], device)
+
+    def __apply(self, snapshots: list[dict]) -> None:
+        for snapshot in snapshots:
+            self.__update(snapshot)
+        for snapshot in snapshots:
+            self.__link(snapshot)
+
+    def __update(self, snapshot: dict) -> None:
+        device = self.__devices.get(snapshot['key'])
+        match snapshot['kind']:
+            case 'drive':
+                if device is None:
+                    device = VirtualDrive(snapshot['name'])
+                device.identifier = snapshot['identifier']
+                device.removable = snapshot['is_removable']
+            case 'volume':
+                if device is None:
+                    device = VirtualVolume(snapshot['name'])
+                device.uuid = snapshot['uuid']
+                device.identifier = snapshot['identifier']
+                device.mountable = snapshot['can_mount']
+            case _:
+                if device is None:
+                    device = VirtualMount(snapshot['name'], Gio.File.new_for_uri(snapshot['root']))
+                device.root = Gio.File.new_for_uri(snapshot['root'])
+                device.uuid = snapshot['uuid']
+                device.unmountable = snapshot['can_unmount']
+                device.set_shadowed(snapshot['is_shadowed'])
+
+        device.name = snapshot['name']
+        if snapshot['icon'] is not None:
+            device.icon = snapshot['icon']
+        device.ejectable = snapshot['can_eject']
+        self.__devices[snapshot['key']] = device
+
+    def __link(self, snapshot: dict) -> None:
+        device = self.__devices[snapshot['key']]
+        match snapshot['kind']:
+            case 'drive':
+                device.volumes = [self.__devices[key] for key in snapshot['volumes'] if key in self.__devices]
+                for volume in device.volumes:
+                    volume.drive = device
+            case 'volume':
+                device.drive = self.__devices.get(snapshot['drive'])
+                device.mount = self.__devices.get(snapshot['mount'])
+            case _:
+                device.volume = self.__devices.get(snapshot['volume'])
+
+
+def main() -> None:
+    import argparse
+    import sys
+
+    from gi.events import GLibEventLoopPolicy
+
+    from . import wrappers
+    from .mountmenu import MountMenu
+
+    parser = argparse.ArgumentParser(description='Replay a recorded hotplug trace into MountMenu.')
+    parser.add_argument('trace')
+    parser.add_argument('--fast', action='store_true', help='do not wait between events')
+    parser.add_argument('--speed', type=float, default=1, help='playback speed factor')
+    args = parser.parse_args()
+
+    asyncio.set_event_loop_policy(GLibEventLoopPolicy())
+    wrappers.wrap_all()
+
+    with open(args.trace, encoding='utf-8') as f:
+        replayer = TraceReplayer(f)
+    mount_menu = MountMenu(volume_monitor=replayer.volume_monitor, filesystem_info_ttl=3600)
+
+    async def replay():
+        started = time.perf_counter()
+        await replayer.play(None if args.fast else args.speed)
+        elapsed = time.perf_counter() - started
+        # Let the last debounced rebuild run before reading the counters.
+        await asyncio.sleep(1)
+        return elapsed
+
+    elapsed = asyncio.get_event_loop().run_until_complete(replay())
+    json.dump({
+        'events': replayer.events,
+        'elapsed_s': round(elapsed, 3),
+        'rebuild_stats': mount_menu.rebuild_stats,
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
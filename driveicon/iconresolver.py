@@ -0,0 +1,98 @@
+import os
+from typing import Callable
+
+from gi.repository import GLib, Gio
+
+from .icontheme import IconThemeIndex
+from .scheduler import CoalescingScheduler
+
+
+_RESCAN_DELAY_MS = 1000
+
+
+class ThemeIconResolver:
+    """Resolves themed icons against an `IconThemeIndex`, preferring symbolic variants.
+
+    The directories the index was built from are monitored; once they settle
+    after a change, such as an icon package being installed, the index is
+    rebuilt and the change callbacks run as they do for a theme switch.
+    """
+
+    def __init__(self, theme_name: str) -> None:
+        self.__index = IconThemeIndex(theme_name)
+        self.__callbacks: list[Callable[[], None]] = []
+        self.__monitors: list[Gio.FileMonitor] = []
+        self.__rescan_scheduler = CoalescingScheduler(
+            self.__on_sources_settled,
+            delay_ms=_RESCAN_DELAY_MS,
+            max_latency_ms=5 * _RESCAN_DELAY_MS,
+        )
+        self.__watch_sources()
+
+    @property
+    def index(self) -> IconThemeIndex:
+        return self.__index
+
+    def set_theme(self, theme_name: str) -> None:
+        if theme_name == self.__index.theme_name:
+            return
+
+        self.__replace_index(IconThemeIndex(theme_name))
+
+    def resolve(self, icon: Gio.ThemedIcon, size: int) -> str | None:
+        candidates = []
+        for name in icon.get_names():
+            symbolic = name if name.endswith('-symbolic') else f'{name}-symbolic'
+            candidates += [symbolic, name]
+
+        # A name drawn for `size` beats an earlier one that would have to be scaled.
+        for exact in (True, False):
+            for candidate in candidates:
+                if self.__index.lookup(candidate, size, exact=exact) is not None:
+                    return candidate
+        return None
+
+    def connect_changed(self, callback: Callable[[], None]) -> None:
+        self.__callbacks.append(callback)
+
+    def __replace_index(self, index: IconThemeIndex) -> None:
+        self.__index = index
+        self.__watch_sources()
+        for callback in self.__callbacks:
+            callback()
+
+    def __watch_sources(self) -> None:
+        for monitor in self.__monitors:
+            monitor.cancel()
+        self.__monitors = []
+
+        for path in self.__index.sources:
+            if not os.path.isdir(path):
+                continue
+            try:
+                monitor = Gio.File.new_for_path(path).monitor_directory(Gio.FileMonitorFlags.NONE, None)
+            except GLib.Error:
+                continue
+            monitor.connect('changed', self.__on_source_changed)
+            self.__monitors.append(monitor)
+
+    def __on_source_changed(self, *_) -> None:
+        self.__rescan_scheduler.schedule()
+
+    def __on_sources_settled(self, _) -> None:
+        if not self.__index.is_current():
+            self.__replace_index(IconThemeIndex(self.__index.theme_name))
+
+
+class NamedIconResolver:
+    """Passes the first name of a themed icon through for the panel to resolve.
+
+    Needs neither Gtk nor a display connection.
+    """
+
+    def resolve(self, icon: Gio.ThemedIcon, size: int) -> str | None:
+        names = icon.get_names()
+        return names[0] if names else None
+
+    def connect_changed(self, callback: Callable[[], None]) -> None:
+        pass
@@ -0,0 +1,297 @@
+import json
+import os
+from typing import NamedTuple
+
+from gi.repository import GLib
+
+
+_CACHE_VERSION = 1
+
+_ICON_EXTENSIONS = ('.png', '.svg', '.xpm')
+
+_FALLBACK_THEME = 'hicolor'
+
+_PIXMAP_DIRECTORIES = ['/usr/share/pixmaps']
+
+
+class _Directory(NamedTuple):
+    type: str
+    size: int
+    min_size: int
+    max_size: int
+    threshold: int
+    scale: int
+
+    def matches(self, size: int, scale: int) -> bool:
+        if self.scale != scale:
+            return False
+
+        match self.type:
+            case 'Fixed':
+                return self.size == size
+            case 'Scalable':
+                return self.min_size <= size <= self.max_size
+            case _:
+                return self.size - self.threshold <= size <= self.size + self.threshold
+
+    def distance(self, size: int, scale: int) -> int:
+        size *= scale
+        match self.type:
+            case 'Fixed':
+                return abs(self.size * self.scale - size)
+            case 'Scalable':
+                if size < self.min_size * self.scale:
+                    return self.min_size * self.scale - size
+                if size > self.max_size * self.scale:
+                    return size - self.max_size * self.scale
+                return 0
+            case _:
+                if size < (self.size - self.threshold) * self.scale:
+                    return (self.size - self.threshold) * self.scale - size
+                if size > (self.size + self.threshold) * self.scale:
+                    return size - (self.size + self.threshold) * self.scale
+                return 0
+
+
+def default_base_directories() -> list[str]:
+    return [
+        os.path.join(GLib.get_user_data_dir(), 'icons'),
+        os.path.join(GLib.get_home_dir(), '.icons'),
+        *(os.path.join(directory, 'icons') for directory in GLib.get_system_data_dirs()),
+    ]
+
+
+def _load_index_theme(path: str) -> GLib.KeyFile | None:
+    key_file = GLib.KeyFile()
+    try:
+        key_file.load_from_file(path, GLib.KeyFileFlags.NONE)
+    except GLib.Error:
+        return None
+    return key_file
+
+
+def _get_list(key_file: GLib.KeyFile, group: str, key: str) -> list[str]:
+    try:
+        return [value for value in key_file.get_string_list(group, key) if value]
+    except GLib.Error:
+        return []
+
+
+def _get_integer(key_file: GLib.KeyFile, group: str, key: str, default: int) -> int:
+    try:
+        return key_file.get_integer(group, key)
+    except GLib.Error:
+        return default
+
+
+def _get_string(key_file: GLib.KeyFile, group: str, key: str, default: str) -> str:
+    try:
+        return key_file.get_string(group, key)
+    except GLib.Error:
+        return default
+
+
+def _theme_directories(key_file: GLib.KeyFile) -> list[tuple[str, _Directory]]:
+    directories = []
+    names = _get_list(key_file, 'Icon Theme', 'Directories')
+    names += _get_list(key_file, 'Icon Theme', 'ScaledDirectories')
+    for name in dict.fromkeys(names):
+        if not key_file.has_group(name):
+            continue
+
+        size = _get_integer(key_file, name, 'Size', 0)
+        directories.append((name, _Directory(
+            _get_string(key_file, name, 'Type', 'Threshold'),
+            size,
+            _get_integer(key_file, name, 'MinSize', size),
+            _get_integer(key_file, name, 'MaxSize', size),
+            _get_integer(key_file, name, 'Threshold', 2),
+            _get_integer(key_file, name, 'Scale', 1),
+        )))
+    return directories
+
+
+def _list_icons(directory: str) -> list[tuple[str, str]]:
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return []
+
+    icons = []
+    with entries:
+        for entry in entries:
+            name, extension = os.path.splitext(entry.name)
+            if extension in _ICON_EXTENSIONS:
+                icons.append((name, entry.path))
+    return icons
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+class IconThemeIndex:
+    """Maps icon names to files following the freedesktop icon theme specification.
+
+    The index covers the theme, everything it inherits and hicolor. It is
+    persisted in the user cache together with the modification times of every
+    directory and index.theme it was built from; as long as a stat sweep over
+    those finds nothing changed, the index is loaded from the cache instead of
+    rescanning the themes.
+    """
+
+    def __init__(
+            self,
+            theme_name: str,
+            *,
+            base_directories: list[str] | None = None,
+            cache_path: str | None = None,
+    ) -> None:
+        self.__theme_name = theme_name
+        self.__base_directories = base_directories or default_base_directories()
+        self.__cache_path = cache_path or os.path.join(
+            GLib.get_user_cache_dir(),
+            'driveicon',
+            f'icon-theme-{theme_name}.json',
+        )
+        self.__directories: list[_Directory] = []
+        self.__icons: dict[str, list[tuple[int, int, str]]] = {}
+        self.__stamp: list[list] = []
+        self.__loaded_from_cache = self.__load_cache()
+        if not self.__loaded_from_cache:
+            self.__scan()
+
+    @property
+    def theme_name(self) -> str:
+        return self.__theme_name
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'icons': len(self.__icons),
+            'directories': len(self.__directories),
+            'loaded_from_cache': int(self.__loaded_from_cache),
+        }
+
+    @property
+    def sources(self) -> list[str]:
+        """The directories and index.theme files the index was built from."""
+        return [path for path, _ in self.__stamp]
+
+    def is_current(self) -> bool:
+        """Whether a stat sweep over `sources` finds them unchanged."""
+        return all(_mtime(path) == mtime for path, mtime in self.__stamp)
+
+    def has_icon(self, name: str) -> bool:
+        return name in self.__icons
+
+    def lookup(self, name: str, size: int, scale = 1, *, exact = False) -> str | None:
+        """Returns the file for `name` at `size`, or the closest size available.
+
+        With `exact`, only a file from a directory that covers `size` is
+        returned.
+        """
+        if not (entries := self.__icons.get(name)):
+            return None
+
+        rank = min(entry_rank for entry_rank, _, _ in entries)
+        candidates = [(index, path) for entry_rank, index, path in entries if entry_rank == rank]
+        for index, path in candidates:
+            if index >= 0 and self.__directories[index].matches(size, scale):
+                return path
+        if exact:
+            return None
+
+        def distance(candidate):
+            index, _ = candidate
+            return self.__directories[index].distance(size, scale) if index >= 0 else size * scale
+
+        _, path = min(candidates, key=distance)
+        return path
+
+    def __theme_chain(self) -> list[str]:
+        chain = []
+
+        def visit(theme):
+            if theme in chain:
+                return
+            chain.append(theme)
+            for base in self.__base_directories:
+                if (key_file := _load_index_theme(os.path.join(base, theme, 'index.theme'))) is not None:
+                    for parent in _get_list(key_file, 'Icon Theme', 'Inherits'):
+                        visit(parent)
+                    return
+
+        visit(self.__theme_name)
+        visit(_FALLBACK_THEME)
+        return chain
+
+    def __scan(self) -> None:
+        stamped = self.__base_directories + _PIXMAP_DIRECTORIES
+        directories = []
+        icons = {}
+
+        themes = self.__theme_chain()
+        for rank, theme in enumerate(themes):
+            key_file = None
+            for base in self.__base_directories:
+                index_path = os.path.join(base, theme, 'index.theme')
+                stamped += [os.path.join(base, theme), index_path]
+                if key_file is None:
+                    key_file = _load_index_theme(index_path)
+            if key_file is None:
+                continue
+
+            for name, directory in _theme_directories(key_file):
+                index = len(directories)
+                directories.append(directory)
+                for base in self.__base_directories:
+                    path = os.path.join(base, theme, name)
+                    stamped.append(path)
+                    for icon_name, icon_path in _list_icons(path):
+                        icons.setdefault(icon_name, []).append((rank, index, icon_path))
+
+        for directory in _PIXMAP_DIRECTORIES:
+            for icon_name, icon_path in _list_icons(directory):
+                icons.setdefault(icon_name, []).append((len(themes), -1, icon_path))
+
+        self.__directories = directories
+        self.__icons = icons
+        self.__stamp = [[path, _mtime(path)] for path in stamped]
+        self.__save_cache()
+
+    def __load_cache(self) -> bool:
+        try:
+            with open(self.__cache_path, encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache['version'] != _CACHE_VERSION or cache['base_directories'] != self.__base_directories:
+                return False
+            self.__stamp = cache['stamp']
+            if not self.is_current():
+                return False
+
+            self.__directories = [_Directory(*directory) for directory in cache['directories']]
+            self.__icons = {
+                name: [tuple(entry) for entry in entries]
+                for name, entries in cache['icons'].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def __save_cache(self) -> None:
+        contents = json.dumps({
+            'version': _CACHE_VERSION,
+            'base_directories': self.__base_directories,
+            'stamp': self.__stamp,
+            'directories': self.__directories,
+            'icons': self.__icons,
+        }, separators=(',', ':'))
+        try:
+            os.makedirs(os.path.dirname(self.__cache_path), exist_ok=True)
+            GLib.file_set_contents(self.__cache_path, contents.encode())
+        except (OSError, GLib.Error):
+            pass
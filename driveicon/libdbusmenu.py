@@ -0,0 +1,228 @@
+from functools import partial
+
+from gi.repository import GLib, Gio, Dbusmenu
+
+from .iconresolver import ThemeIconResolver, NamedIconResolver
+from .menuexport import (
+    DBusMenuEvent,
+    DBusMenuItemProperty,
+    DBusMenuItemType,
+    IconCache,
+    MenuModelExporter,
+)
+from .pixmap import PixmapCache
+
+
+class _DBusMenuProxy(MenuModelExporter[Dbusmenu.Menuitem]):
+    def __init__(
+            self,
+            object_path: str,
+            root_menu: Gio.MenuModel,
+            action_group: Gio.ActionGroup,
+            pixmap_cache: PixmapCache,
+            icon_resolver: ThemeIconResolver | NamedIconResolver,
+            *,
+            lazy_submenus = False,
+            lazy_idle_timeout = 30,
+    ) -> None:
+        super().__init__(action_group)
+        self.__root_menu = root_menu
+        self.__lazy_submenus = lazy_submenus
+        self.__lazy_idle_timeout = lazy_idle_timeout
+        self.__root_node = Dbusmenu.Menuitem()
+        self.__lazy_items: dict[Dbusmenu.Menuitem, Gio.MenuModel] = {}
+        self.__materialized_items: dict[Dbusmenu.Menuitem, tuple[Gio.MenuModel, int | None]] = {}
+        self.__server = Dbusmenu.Server(
+            dbus_object=object_path,
+            root_node=self.__root_node
+        )
+        self.__icon_cache = IconCache(icon_resolver, pixmap_cache)
+        self.__items_created = 0
+        self.__items_destroyed = 0
+
+        self.__rebuild_menu()
+
+    @property
+    def icon_cache_stats(self) -> dict[str, int]:
+        return self.__icon_cache.stats
+
+    @property
+    def item_stats(self) -> dict[str, int]:
+        return {'created': self.__items_created, 'destroyed': self.__items_destroyed}
+
+    def __populate(self, container: Dbusmenu.Menuitem, menu: Gio.MenuModel) -> bool:
+        children = self._build_children(container, menu)
+        for child in children:
+            container.child_append(child)
+
+        return len(children) > 0
+
+    def _build_item(
+            self,
+            attrs: Gio.MenuAttributeIter,
+            submenu: Gio.MenuModel | None = None,
+            is_section_header = False,
+    ) -> Dbusmenu.Menuitem:
+        item = Dbusmenu.Menuitem()
+        self.__items_created += 1
+        action = None
+        target = None
+
+        def activate_action(action_group, action, target, *_):
+            action_group.activate_action(action, target)
+
+        for name, value in attrs:
+            match name:
+                case Gio.MENU_ATTRIBUTE_TARGET:
+                    target = value
+                case Gio.MENU_ATTRIBUTE_ACTION:
+                    action = value.get_string()
+                case Gio.MENU_ATTRIBUTE_LABEL:
+                    item.property_set(DBusMenuItemProperty.LABEL, value.get_string())
+                case Gio.MENU_ATTRIBUTE_ICON:
+                    match self.__icon_cache.lookup(value):
+                        case (DBusMenuItemProperty.ICON_NAME, icon_name):
+                            item.property_set(DBusMenuItemProperty.ICON_NAME, icon_name)
+                        case (DBusMenuItemProperty.ICON_DATA, icon_data):
+                            item.property_set_byte_array(DBusMenuItemProperty.ICON_DATA, icon_data)
+
+        if is_section_header:
+            item.property_set_bool(DBusMenuItemProperty.ENABLED, False)
+            return item
+
+        if action is not None:
+            item.connect('item-activated', partial(activate_action, self._action_group, action, target))
+
+            enabled, toggle = self._bind_action(item, action, target)
+            item.property_set_bool(DBusMenuItemProperty.ENABLED, enabled)
+            if toggle is not None:
+                toggle_type, toggle_state = toggle
+                item.property_set(DBusMenuItemProperty.TOGGLE_TYPE, toggle_type)
+                item.property_set_int(DBusMenuItemProperty.TOGGLE_STATE, toggle_state)
+
+        if submenu is not None:
+            if self.__lazy_submenus:
+                item.connect('about-to-show', self.__on_about_to_show)
+                item.connect('event', self.__on_event)
+                self.__defer_submenu(item, submenu)
+            elif self.__populate(item, submenu):
+                item.property_set(DBusMenuItemProperty.CHILDREN_DISPLAY, 'submenu')
+
+        return item
+
+    def _build_separator(self) -> Dbusmenu.Menuitem:
+        item = Dbusmenu.Menuitem()
+        self.__items_created += 1
+        item.property_set(DBusMenuItemProperty.TYPE, DBusMenuItemType.SEPARATOR)
+        return item
+
+    def _remove_children(self, container: Dbusmenu.Menuitem, offset: int, items: list[Dbusmenu.Menuitem]) -> None:
+        for item in items:
+            container.child_delete(item)
+            self.__release_item(item)
+
+    def _insert_children(self, container: Dbusmenu.Menuitem, offset: int, items: list[Dbusmenu.Menuitem]) -> None:
+        for item in items:
+            container.child_add_position(item, offset)
+            offset += 1
+
+    def _set_enabled(self, item: Dbusmenu.Menuitem, enabled: bool) -> None:
+        item.property_set_bool(DBusMenuItemProperty.ENABLED, enabled)
+
+    def _set_toggle_state(self, item: Dbusmenu.Menuitem, state: int) -> None:
+        item.property_set_int(DBusMenuItemProperty.TOGGLE_STATE, state)
+
+    def __defer_submenu(self, item: Dbusmenu.Menuitem, submenu: Gio.MenuModel) -> None:
+        self._watch_model(submenu, item, submenu)
+        self.__lazy_items[item] = submenu
+        self.__update_children_display(item, submenu.get_n_items() > 0)
+
+    def __materialize_submenu(self, item: Dbusmenu.Menuitem) -> None:
+        if (submenu := self.__lazy_items.pop(item, None)) is not None:
+            self.__populate(item, submenu)
+            self.__materialized_items[item] = submenu, None
+        elif (materialized := self.__materialized_items.get(item)) is not None:
+            submenu, source_id = materialized
+            if source_id is not None:
+                GLib.source_remove(source_id)
+                self.__materialized_items[item] = submenu, None
+
+    def __schedule_release(self, item: Dbusmenu.Menuitem) -> None:
+        if (materialized := self.__materialized_items.get(item)) is None:
+            return
+
+        submenu, source_id = materialized
+        if source_id is not None:
+            GLib.source_remove(source_id)
+        source_id = GLib.timeout_add_seconds(
+            self.__lazy_idle_timeout,
+            partial(self.__on_materialized_idle, item),
+        )
+        self.__materialized_items[item] = submenu, source_id
+
+    def __on_materialized_idle(self, item: Dbusmenu.Menuitem) -> bool:
+        submenu, _ = self.__materialized_items.pop(item)
+        self._release_models(item)
+        for child in item.take_children():
+            self.__release_item(child)
+        self.__defer_submenu(item, submenu)
+        return GLib.SOURCE_REMOVE
+
+    def __on_about_to_show(self, item: Dbusmenu.Menuitem) -> bool:
+        self.__materialize_submenu(item)
+        return False
+
+    def __on_event(self, item: Dbusmenu.Menuitem, name: str, *_) -> bool:
+        match name:
+            case DBusMenuEvent.OPENED:
+                self.__materialize_submenu(item)
+            case DBusMenuEvent.CLOSED:
+                self.__schedule_release(item)
+        return False
+
+    def __rebuild_menu(self) -> None:
+        self.__rebuild_container(self.__root_node, self.__root_menu)
+
+    def __rebuild_container(self, container: Dbusmenu.Menuitem, menu: Gio.MenuModel) -> None:
+        self._release_models(container)
+        for child in container.take_children():
+            self.__release_item(child)
+
+        self.__update_children_display(container, self.__populate(container, menu))
+
+    def __update_children_display(self, container: Dbusmenu.Menuitem, has_children: bool) -> None:
+        if container is self.__root_node:
+            return
+        if has_children:
+            container.property_set(DBusMenuItemProperty.CHILDREN_DISPLAY, 'submenu')
+        else:
+            container.property_remove(DBusMenuItemProperty.CHILDREN_DISPLAY)
+
+    def __release_item(self, item: Dbusmenu.Menuitem) -> None:
+        self.__items_destroyed += 1
+        self.__lazy_items.pop(item, None)
+        if (materialized := self.__materialized_items.pop(item, None)) is not None and materialized[1] is not None:
+            GLib.source_remove(materialized[1])
+
+        self._forget_item(item)
+        for child in item.get_children():
+            self.__release_item(child)
+
+    def _on_items_changed(
+            self,
+            menu: Gio.MenuModel,
+            container: Dbusmenu.Menuitem,
+            container_menu: Gio.MenuModel,
+            position: int,
+            removed: int,
+            added: int,
+    ) -> None:
+        if container in self.__lazy_items:
+            self.__update_children_display(container, menu.get_n_items() > 0)
+            return
+
+        if not self._splice(menu, position, removed, added):
+            self.__rebuild_container(container, container_menu)
+            return
+
+        self.__update_children_display(container, len(container.get_children()) > 0)
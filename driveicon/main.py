@@ -1,3 +1,7 @@
+import time
+
+_imports_started = time.perf_counter()
+
 import gi
 
 gi.require_versions({
@@ -5,28 +9,94 @@ gi.require_versions({
     'Gio': '2.0',
     'GObject': '2.0',
     'Pango': '1.0',
+    'GdkPixbuf': '2.0',
     'Dbusmenu': '0.4',
 })
 
 import asyncio
-from gi.repository import Gtk, Gio
+import sys
+from gi.repository import Gio, GLib
 from gi.events import GLibEventLoopPolicy
 
-from .trayicon import TrayIcon, SNIStatus
 from . import wrappers
-from .mountmenu import MountMenu
+from .startupprofile import StartupProfile
+
+_imports_finished = time.perf_counter()
+
+
+def on_activate(application: Gio.Application):
+    profile = application.startup_profile
+
+    with profile.phase('imports (deferred)'):
+        from .trayicon import TrayIcon, SNIStatus
+        from .dbusmenu import DBusMenuBackend
+        from .mountmenu import MountMenu
+        from .menusnapshot import load_menu_snapshot, save_menu_snapshot
+        from .frontend import gtk_frontend, headless_frontend
+        from .metrics import MetricsService
+        from .diagnostics import SignalDiagnostics
+
+    application.diagnostics = SignalDiagnostics()
+
+    with profile.phase('frontend'):
+        frontend = headless_frontend(application) if application.headless else gtk_frontend(application)
 
+    with profile.phase('snapshot-load'):
+        snapshot = load_menu_snapshot()
 
-def on_activate(application: Gtk.Application):
-    application.mount_manager = MountMenu(application)
+    volume_monitor = None
+    volume_monitor_ready = None
+    if application.udisks:
+        with profile.phase('volume-monitor'):
+            from .udisks2 import UDisks2VolumeMonitor
+            volume_monitor = UDisks2VolumeMonitor()
+            volume_monitor_ready = volume_monitor.ready
+    elif snapshot is None or application.trace_file is not None:
+        with profile.phase('volume-monitor'):
+            volume_monitor = Gio.VolumeMonitor.get()
+            volume_monitor.get_connected_drives()
+            volume_monitor.get_volumes()
+            volume_monitor.get_mounts()
 
+    if application.trace_file is not None:
+        from .hotplugtrace import TraceRecorder
+        trace_recorder = TraceRecorder(volume_monitor, application.trace_file)
+        application.connect('shutdown', lambda _: trace_recorder.stop())
+
+    with profile.phase('menu-build'):
+        application.mount_manager = MountMenu(
+            volume_monitor=volume_monitor,
+            volume_monitor_ready=volume_monitor_ready,
+            mount_operation=frontend.mount_operation,
+            launch_context=frontend.launch_context,
+            snapshot=snapshot,
+        )
+
+    profile.begin('sni-registration')
     application.tray_icon = TrayIcon(
         id=application.get_application_id(),
         title='Drives',
         icon=Gio.ThemedIcon(name='drive-removable-media'),
         action_group=application.mount_manager.action_group,
         menu_model=application.mount_manager.menu,
+        status=SNIStatus.ACTIVE if application.mount_manager.menu.get_n_items() > 0 else SNIStatus.PASSIVE,
         item_is_menu=True,
+        menu_backend=DBusMenuBackend(application.menu_backend),
+        lazy_menu=application.lazy_menu,
+        icon_resolver=frontend.icon_resolver,
+    )
+
+    def on_registered(tray_icon):
+        profile.end('sni-registration')
+        tray_icon.disconnect(registered_handler)
+        if application.profile_startup:
+            profile.report()
+
+    registered_handler = application.tray_icon.connect('registered', on_registered)
+
+    application.metrics_service = MetricsService(
+        application.tray_icon.bus,
+        [lambda: application.mount_manager.metrics, lambda: application.tray_icon.metrics],
     )
 
     def set_visibility(_, menu):
@@ -35,15 +105,128 @@ def on_activate(application: Gtk.Application):
         else:
             application.tray_icon.status = SNIStatus.ACTIVE
 
-    set_visibility(None, application.mount_manager.menu)
+    def set_tooltip(mount_manager, _menu):
+        usage = mount_manager.filesystem_usage
+        if not usage:
+            application.tray_icon.tooltip = None
+            return
+
+        description = '\n'.join(f'{name}: {mount_usage.describe()}' for name, mount_usage in usage)
+        application.tray_icon.tooltip = (None, 'Drives', description)
+
+    saved_entries = snapshot.get('entries') if snapshot is not None else None
+
+    def save_snapshot(mount_manager, _menu):
+        # Usage-only label changes leave the snapshot as it is; skip rewriting it.
+        nonlocal saved_entries
+        data = mount_manager.snapshot()
+        if data['entries'] != saved_entries:
+            save_menu_snapshot(data)
+            saved_entries = data['entries']
+
+    set_tooltip(application.mount_manager, application.mount_manager.menu)
+    if snapshot is None and volume_monitor_ready is None:
+        save_snapshot(application.mount_manager, application.mount_manager.menu)
     application.mount_manager.connect('menu-changed', set_visibility)
+    application.mount_manager.connect('menu-changed', set_tooltip)
+    application.mount_manager.connect('menu-changed', save_snapshot)
+
+
+def on_handle_local_options(application: Gio.Application, options: GLib.VariantDict) -> int:
+    application.lazy_menu = options.contains('lazy-menu')
+    application.profile_startup = options.contains('profile-startup')
+    application.udisks = options.contains('udisks')
+
+    menu_backend = options.lookup_value('menu-backend', GLib.VariantType.new('s'))
+    application.menu_backend = menu_backend.get_string() if menu_backend is not None else 'libdbusmenu'
+    if menu_backend is not None:
+        from .dbusmenu import DBusMenuBackend
+        try:
+            DBusMenuBackend(application.menu_backend)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    record_trace = options.lookup_value('record-trace', GLib.VariantType.new('ay'))
+    application.trace_file = None
+    if record_trace is not None:
+        try:
+            application.trace_file = open(record_trace.get_bytestring().decode(), 'w', encoding='utf-8')
+        except OSError as e:
+            print(f'driveicon: cannot record trace: {e}', file=sys.stderr)
+            return 1
+
+    return -1
 
 
 def main():
+    profile = StartupProfile()
+    profile.add('imports', _imports_finished - _imports_started)
+
     asyncio.set_event_loop_policy(GLibEventLoopPolicy())
-    wrappers.wrap_all()
+    with profile.phase('wrap_all'):
+        wrappers.wrap_all()
 
-    app = Gtk.Application(application_id='one.markle.DriveIcon')
+    # The application class has to be chosen before GApplication parses the
+    # command line, so --headless is looked up in argv directly.
+    headless = '--headless' in sys.argv[1:]
+    if headless:
+        app = Gio.Application(application_id='one.markle.DriveIcon')
+    else:
+        with profile.phase('gtk-import'):
+            from gi.repository import Gtk
+        app = Gtk.Application(application_id='one.markle.DriveIcon')
+    app.startup_profile = profile
+    app.headless = headless
+    app.add_main_option(
+        'lazy-menu',
+        0,
+        GLib.OptionFlags.NONE,
+        GLib.OptionArg.NONE,
+        'Build submenus only when the panel is about to show them',
+        None,
+    )
+    app.add_main_option(
+        'menu-backend',
+        0,
+        GLib.OptionFlags.NONE,
+        GLib.OptionArg.STRING,
+        'D-Bus menu implementation to publish: libdbusmenu (default) or native',
+        'BACKEND',
+    )
+    app.add_main_option(
+        'headless',
+        0,
+        GLib.OptionFlags.NONE,
+        GLib.OptionArg.NONE,
+        'Run without Gtk or a display connection; mount dialogs are unavailable',
+        None,
+    )
+    app.add_main_option(
+        'udisks',
+        0,
+        GLib.OptionFlags.NONE,
+        GLib.OptionArg.NONE,
+        'Read drives and filesystems straight from UDisks2 instead of the gvfs volume monitors',
+        None,
+    )
+    app.add_main_option(
+        'record-trace',
+        0,
+        GLib.OptionFlags.NONE,
+        GLib.OptionArg.FILENAME,
+        'Log every volume monitor signal with device snapshots to FILE for offline replay',
+        'FILE',
+    )
+    app.add_main_option(
+        'profile-startup',
+        0,
+        GLib.OptionFlags.NONE,
+        GLib.OptionArg.NONE,
+        'Print a per-phase startup time breakdown once the icon is registered',
+        None,
+    )
+    app.connect('handle-local-options', on_handle_local_options)
     app.connect('activate', on_activate)
 
     try:
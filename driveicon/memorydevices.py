@@ -0,0 +1,247 @@
+"""Gio drives, volumes and mounts whose state lives in plain attributes.
+
+These are the base for volume monitors that do not come from gvfs: the UDisks2
+backend, and the virtual devices benchmarks and trace replay drive by hand.
+"""
+
+from gi.repository import GObject, Gio
+
+
+def _icon(name: str) -> Gio.Icon:
+    return Gio.Icon.new_for_string(name)
+
+
+class MemoryDrive(GObject.Object, Gio.Drive):
+    def __init__(
+            self,
+            name: str,
+            *,
+            icon = 'drive-removable-media',
+            identifier: str | None = None,
+            can_eject = True,
+            removable = True,
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self.icon = icon
+        self.identifier = identifier
+        self.ejectable = can_eject
+        self.removable = removable
+        self.volumes: list['MemoryVolume'] = []
+
+    def add_volume(self, volume: 'MemoryVolume') -> None:
+        volume.drive = self
+        self.volumes.append(volume)
+
+    def do_get_name(self) -> str:
+        return self.name
+
+    def do_get_icon(self) -> Gio.Icon:
+        return _icon(self.icon)
+
+    def do_get_symbolic_icon(self) -> Gio.Icon:
+        return _icon(f'{self.icon}-symbolic')
+
+    def do_has_volumes(self) -> bool:
+        return bool(self.volumes)
+
+    def do_get_volumes(self) -> list[Gio.Volume]:
+        return list(self.volumes)
+
+    def do_has_media(self) -> bool:
+        return True
+
+    def do_is_media_removable(self) -> bool:
+        return self.removable
+
+    def do_is_removable(self) -> bool:
+        return self.removable
+
+    def do_can_eject(self) -> bool:
+        return self.ejectable
+
+    def do_get_identifier(self, kind: str) -> str | None:
+        return self.identifier if kind == Gio.DRIVE_IDENTIFIER_KIND_UNIX_DEVICE else None
+
+    def do_enumerate_identifiers(self) -> list[str]:
+        return [Gio.DRIVE_IDENTIFIER_KIND_UNIX_DEVICE] if self.identifier is not None else []
+
+
+class MemoryVolume(GObject.Object, Gio.Volume):
+    def __init__(
+            self,
+            name: str,
+            *,
+            icon = 'drive-harddisk',
+            uuid: str | None = None,
+            identifier: str | None = None,
+            can_mount = True,
+            can_eject = False,
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self.icon = icon
+        self.uuid = uuid
+        self.identifier = identifier
+        self.mountable = can_mount
+        self.ejectable = can_eject
+        self.drive: MemoryDrive | None = None
+        self.mount: MemoryMount | None = None
+
+    def set_mount(self, mount: 'MemoryMount | None') -> None:
+        if mount is not None:
+            mount.volume = self
+        self.mount = mount
+
+    def do_get_name(self) -> str:
+        return self.name
+
+    def do_get_icon(self) -> Gio.Icon:
+        return _icon(self.icon)
+
+    def do_get_symbolic_icon(self) -> Gio.Icon:
+        return _icon(f'{self.icon}-symbolic')
+
+    def do_get_uuid(self) -> str | None:
+        return self.uuid
+
+    def do_get_drive(self) -> Gio.Drive | None:
+        return self.drive
+
+    def do_get_mount(self) -> Gio.Mount | None:
+        return self.mount
+
+    def do_can_mount(self) -> bool:
+        return self.mountable
+
+    def do_can_eject(self) -> bool:
+        return self.ejectable
+
+    def do_should_automount(self) -> bool:
+        return False
+
+    def do_get_activation_root(self) -> Gio.File | None:
+        return None
+
+    def do_get_identifier(self, kind: str) -> str | None:
+        return self.identifier if kind == Gio.VOLUME_IDENTIFIER_KIND_UNIX_DEVICE else None
+
+    def do_enumerate_identifiers(self) -> list[str]:
+        return [Gio.VOLUME_IDENTIFIER_KIND_UNIX_DEVICE] if self.identifier is not None else []
+
+
+class MemoryMount(GObject.Object, Gio.Mount):
+    def __init__(
+            self,
+            name: str,
+            root: Gio.File,
+            *,
+            icon = 'drive-harddisk',
+            uuid: str | None = None,
+            can_unmount = True,
+            can_eject = False,
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self.root = root
+        self.icon = icon
+        self.uuid = uuid
+        self.unmountable = can_unmount
+        self.ejectable = can_eject
+        self.volume: MemoryVolume | None = None
+
+    def do_get_root(self) -> Gio.File:
+        return self.root
+
+    def do_get_name(self) -> str:
+        return self.name
+
+    def do_get_icon(self) -> Gio.Icon:
+        return _icon(self.icon)
+
+    def do_get_symbolic_icon(self) -> Gio.Icon:
+        return _icon(f'{self.icon}-symbolic')
+
+    def do_get_uuid(self) -> str | None:
+        return self.uuid
+
+    def do_get_volume(self) -> Gio.Volume | None:
+        return self.volume
+
+    def do_get_drive(self) -> Gio.Drive | None:
+        return self.volume.drive if self.volume is not None else None
+
+    def do_can_unmount(self) -> bool:
+        return self.unmountable
+
+    def do_can_eject(self) -> bool:
+        return self.ejectable
+
+
+class MemoryVolumeMonitor(Gio.VolumeMonitor):
+    """A volume monitor over devices held in memory.
+
+    Whoever owns the monitor creates and changes the devices; every mutation
+    emits the signals the gvfs monitors would.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.drives: list[MemoryDrive] = []
+        self.standalone_volumes: list[MemoryVolume] = []
+        self.standalone_mounts: list[MemoryMount] = []
+
+    def do_get_connected_drives(self) -> list[Gio.Drive]:
+        return list(self.drives)
+
+    def do_get_volumes(self) -> list[Gio.Volume]:
+        return [volume for drive in self.drives for volume in drive.volumes] + self.standalone_volumes
+
+    def do_get_mounts(self) -> list[Gio.Mount]:
+        mounts = [volume.mount for volume in self.do_get_volumes() if volume.mount is not None]
+        return mounts + self.standalone_mounts
+
+    def connect_drive(self, drive: MemoryDrive) -> None:
+        self.drives.append(drive)
+        self.emit('drive-connected', drive)
+        for volume in drive.volumes:
+            self.emit('volume-added', volume)
+            if volume.mount is not None:
+                self.emit('mount-added', volume.mount)
+
+    def disconnect_drive(self, drive: MemoryDrive) -> None:
+        self.drives.remove(drive)
+        for volume in drive.volumes:
+            if volume.mount is not None:
+                self.emit('mount-removed', volume.mount)
+            self.emit('volume-removed', volume)
+        self.emit('drive-disconnected', drive)
+
+    def add_volume(self, volume: MemoryVolume) -> None:
+        self.standalone_volumes.append(volume)
+        self.emit('volume-added', volume)
+
+    def remove_volume(self, volume: MemoryVolume) -> None:
+        self.standalone_volumes.remove(volume)
+        self.emit('volume-removed', volume)
+
+    def mount_volume(self, volume: MemoryVolume, mount: MemoryMount) -> None:
+        volume.set_mount(mount)
+        self.emit('mount-added', mount)
+        self.emit('volume-changed', volume)
+
+    def unmount_volume(self, volume: MemoryVolume) -> None:
+        mount = volume.mount
+        volume.set_mount(None)
+        if mount is not None:
+            self.emit('mount-removed', mount)
+        self.emit('volume-changed', volume)
+
+    def changed(self, device: MemoryDrive | MemoryVolume | MemoryMount) -> None:
+        match device:
+            case MemoryDrive():
+                self.emit('drive-changed', device)
+            case MemoryVolume():
+                self.emit('volume-changed', device)
+            case _:
+                self.emit('mount-changed', device)
@@ -0,0 +1,316 @@
+"""What both dbusmenu backends share: the protocol constants, menu icon
+resolution, and the bookkeeping that keeps published items in step with a
+Gio.MenuModel and its action group.
+"""
+
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+from gi.repository import GLib, Gio
+
+from .iconresolver import ThemeIconResolver, NamedIconResolver
+from .pixmap import PixmapCache
+
+
+class DBusMenuItemType:
+    STANDARD = 'standard'
+    SEPARATOR = 'separator'
+
+
+class DBusMenuItemToggleType:
+    CHECKMARK = 'checkmark'
+    RADIO = 'radio'
+    NONE = ''
+
+
+class DBusMenuItemToggleState:
+    OFF = 0
+    ON = 1
+    INDETERMINATE = -1
+
+
+class DBusMenuEvent:
+    CLICKED = 'clicked'
+    HOVERED = 'hovered'
+    OPENED = 'opened'
+    CLOSED = 'closed'
+
+
+class DBusMenuItemProperty:
+    TYPE = 'type'
+    LABEL = 'label'
+    ENABLED = 'enabled'
+    VISIBLE = 'visible'
+    ICON_NAME = 'icon-name'
+    ICON_DATA = 'icon-data'
+    SHORTCUT = 'shortcut'
+    TOGGLE_TYPE = 'toggle-type'
+    TOGGLE_STATE = 'toggle-state'
+    CHILDREN_DISPLAY = 'children-display'
+
+
+_VARIANT_TYPE_STRING = GLib.VariantType.new('s')
+_VARIANT_TYPE_BOOL = GLib.VariantType.new('b')
+
+_VARIANT_BOOL_TRUE = GLib.Variant.new_boolean(True)
+
+_MENU_ICON_SIZE = 24
+
+
+class IconCache:
+    def __init__(
+            self,
+            icon_resolver: ThemeIconResolver | NamedIconResolver,
+            pixmap_cache: PixmapCache,
+            max_size = 256,
+    ) -> None:
+        self.__icon_resolver = icon_resolver
+        self.__pixmap_cache = pixmap_cache
+        self.__max_size = max_size
+        self.__entries: OrderedDict[str, tuple[str, str | bytes] | None] = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__icon_resolver.connect_changed(self.__on_theme_changed)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.__hits,
+            'misses': self.__misses,
+            'size': len(self.__entries),
+        }
+
+    def lookup(self, value: GLib.Variant) -> tuple[str, str | bytes] | None:
+        key = value.print_(True)
+        if key in self.__entries:
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+            return self.__entries[key]
+
+        self.__misses += 1
+        resolved = self.__resolve(Gio.Icon.deserialize(value))
+        self.__entries[key] = resolved
+        if len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+        return resolved
+
+    def __resolve(self, icon: Gio.Icon | None) -> tuple[str, str | bytes] | None:
+        if not isinstance(icon, Gio.ThemedIcon):
+            if (data := self.__pixmap_cache.png(icon, _MENU_ICON_SIZE)) is None:
+                return None
+            return DBusMenuItemProperty.ICON_DATA, data
+
+        if (icon_name := self.__icon_resolver.resolve(icon, _MENU_ICON_SIZE)) is None:
+            return None
+        return DBusMenuItemProperty.ICON_NAME, icon_name
+
+    def __on_theme_changed(self) -> None:
+        self.__entries.clear()
+
+
+def _can_splice(
+        menu: Gio.MenuModel,
+        slots: list[tuple[bool, list]],
+        position: int,
+        removed: int,
+        added: int,
+) -> bool:
+    # Separators around a section depend on what precedes it, so only runs of
+    # plain items that do not follow a section, and do not make a section the
+    # first item or stop it being one, can be replaced in place.
+    if any(is_section for is_section, _ in slots[position:position + removed]):
+        return False
+    if any(menu.get_item_link(i, Gio.MENU_LINK_SECTION) is not None for i in range(position, position + added)):
+        return False
+    if position > 0 and slots[position - 1][0]:
+        return False
+    if position == 0 and (removed == 0) != (added == 0) and len(slots) > removed and slots[removed][0]:
+        return False
+    return True
+
+
+_Item = TypeVar('_Item')
+
+
+class MenuModelExporter(Generic[_Item]):
+    """Flattens menu models into dbusmenu items and tracks what each became.
+
+    Every model a container shows is watched for `items-changed`, and every
+    item of a container's own model is recorded with the items it was
+    published as, so that a changed range can be spliced instead of the whole
+    container rebuilt. Items bound to an action follow its enabled and toggle
+    state. Subclasses create the items and publish the changes.
+    """
+
+    def __init__(self, action_group: Gio.ActionGroup) -> None:
+        self._action_group = action_group
+        self.__models: dict[Gio.MenuModel, tuple[int, _Item, Gio.MenuModel]] = {}
+        self.__container_models: dict[_Item, list[Gio.MenuModel]] = {}
+        self.__slots: dict[Gio.MenuModel, list[tuple[bool, list[_Item]]]] = {}
+        self.__action_items: dict[str, dict[_Item, GLib.Variant | None]] = {}
+        self.__item_actions: dict[_Item, str] = {}
+
+        action_group.connect('action-enabled-changed', self.__on_action_enabled_changed)
+        action_group.connect('action-state-changed', self.__on_action_state_changed)
+        action_group.connect('action-added', self.__on_action_added)
+        action_group.connect('action-removed', self.__on_action_removed)
+
+    def _build_item(
+            self,
+            attrs: Gio.MenuAttributeIter,
+            submenu: Gio.MenuModel | None = None,
+            is_section_header = False,
+    ) -> _Item:
+        raise NotImplementedError
+
+    def _build_separator(self) -> _Item:
+        raise NotImplementedError
+
+    def _remove_children(self, container: _Item, offset: int, items: list[_Item]) -> None:
+        raise NotImplementedError
+
+    def _insert_children(self, container: _Item, offset: int, items: list[_Item]) -> None:
+        raise NotImplementedError
+
+    def _set_enabled(self, item: _Item, enabled: bool) -> None:
+        raise NotImplementedError
+
+    def _set_toggle_state(self, item: _Item, state: int) -> None:
+        raise NotImplementedError
+
+    def _on_items_changed(
+            self,
+            menu: Gio.MenuModel,
+            container: _Item,
+            container_menu: Gio.MenuModel,
+            position: int,
+            removed: int,
+            added: int,
+    ) -> None:
+        raise NotImplementedError
+
+    def _watch_model(self, menu: Gio.MenuModel, container: _Item, container_menu: Gio.MenuModel) -> None:
+        if menu in self.__models:
+            return
+
+        handler_id = menu.connect('items-changed', self.__on_items_changed)
+        self.__models[menu] = (handler_id, container, container_menu)
+        self.__container_models.setdefault(container, []).append(menu)
+
+    def _build_children(self, container: _Item, menu: Gio.MenuModel) -> list[_Item]:
+        slots = self.__build_slots(menu, container, menu)
+        self.__slots[menu] = slots
+        return [item for _, items in slots for item in items]
+
+    def _splice(self, menu: Gio.MenuModel, position: int, removed: int, added: int) -> bool:
+        _, container, container_menu = self.__models[menu]
+        slots = self.__slots.get(menu)
+        if menu is not container_menu or slots is None or not _can_splice(menu, slots, position, removed, added):
+            return False
+
+        offset = sum(len(items) for _, items in slots[:position])
+        old_items = [item for _, items in slots[position:position + removed] for item in items]
+        self._remove_children(container, offset, old_items)
+
+        new_slots = [self.__build_slot(menu, i, container, menu, False) for i in range(position, position + added)]
+        slots[position:position + removed] = new_slots
+        self._insert_children(container, offset, [item for _, items in new_slots for item in items])
+        return True
+
+    def _release_models(self, container: _Item) -> None:
+        for model in self.__container_models.pop(container, []):
+            handler_id, *_ = self.__models.pop(model)
+            model.disconnect(handler_id)
+            self.__slots.pop(model, None)
+
+    def _bind_action(
+            self,
+            item: _Item,
+            action: str,
+            target: GLib.Variant | None,
+    ) -> tuple[bool, tuple[str, int] | None]:
+        """Makes `item` follow `action`.
+
+        Returns whether the action is enabled and, for stateful actions, the
+        toggle type and state the item starts with.
+        """
+        expected_value = None
+        toggle = None
+        state_type = self._action_group.get_action_state_type(action)
+        if state_type == _VARIANT_TYPE_STRING or state_type == _VARIANT_TYPE_BOOL:
+            is_string = state_type == _VARIANT_TYPE_STRING
+            expected_value = target if is_string else _VARIANT_BOOL_TRUE
+            toggle = (
+                DBusMenuItemToggleType.RADIO if is_string else DBusMenuItemToggleType.CHECKMARK,
+                self.__toggle_state(self._action_group.get_action_state(action), expected_value),
+            )
+
+        self.__action_items.setdefault(action, {})[item] = expected_value
+        self.__item_actions[item] = action
+        return self._action_group.get_action_enabled(action), toggle
+
+    def _forget_item(self, item: _Item) -> None:
+        if (action := self.__item_actions.pop(item, None)) is not None:
+            self.__action_items.get(action, {}).pop(item, None)
+        self._release_models(item)
+
+    def __build_slots(
+            self,
+            menu: Gio.MenuModel,
+            container: _Item,
+            container_menu: Gio.MenuModel,
+    ) -> list[tuple[bool, list[_Item]]]:
+        self._watch_model(menu, container, container_menu)
+
+        slots = []
+        for i in range(menu.get_n_items()):
+            follows_section = len(slots) > 0 and slots[-1][0]
+            slots.append(self.__build_slot(menu, i, container, container_menu, follows_section))
+        return slots
+
+    def __build_slot(
+            self,
+            menu: Gio.MenuModel,
+            i: int,
+            container: _Item,
+            container_menu: Gio.MenuModel,
+            follows_section: bool,
+    ) -> tuple[bool, list[_Item]]:
+        if (section := menu.get_item_link(i, Gio.MENU_LINK_SECTION)) is not None:
+            items = [self._build_separator()] if i > 0 else []
+            if menu.get_item_attribute_value(i, Gio.MENU_ATTRIBUTE_LABEL) is not None:
+                items.append(self._build_item(menu.iterate_item_attributes(i), is_section_header=True))
+            for _, section_items in self.__build_slots(section, container, container_menu):
+                items += section_items
+            return True, items
+
+        items = [self._build_separator()] if follows_section else []
+        items.append(self._build_item(
+            menu.iterate_item_attributes(i),
+            menu.get_item_link(i, Gio.MENU_LINK_SUBMENU),
+        ))
+        return False, items
+
+    @staticmethod
+    def __toggle_state(value: GLib.Variant, expected_value: GLib.Variant) -> int:
+        return DBusMenuItemToggleState.ON if value == expected_value else DBusMenuItemToggleState.OFF
+
+    def __on_items_changed(self, menu: Gio.MenuModel, position: int, removed: int, added: int) -> None:
+        _, container, container_menu = self.__models[menu]
+        self._on_items_changed(menu, container, container_menu, position, removed, added)
+
+    def __on_action_enabled_changed(self, _, name: str, enabled: bool) -> None:
+        for item in list(self.__action_items.get(name, {})):
+            self._set_enabled(item, enabled)
+
+    def __on_action_added(self, action_group: Gio.ActionGroup, name: str) -> None:
+        # Items restored from a snapshot are published before their actions exist.
+        self.__on_action_enabled_changed(action_group, name, action_group.get_action_enabled(name))
+
+    def __on_action_removed(self, action_group: Gio.ActionGroup, name: str) -> None:
+        self.__on_action_enabled_changed(action_group, name, False)
+
+    def __on_action_state_changed(self, _, name: str, value: GLib.Variant) -> None:
+        for item, expected_value in list(self.__action_items.get(name, {}).items()):
+            if expected_value is not None:
+                self._set_toggle_state(item, self.__toggle_state(value, expected_value))
@@ -0,0 +1,34 @@
+import json
+import os
+
+from gi.repository import GLib
+
+
+_SNAPSHOT_VERSION = 1
+
+
+def default_snapshot_path() -> str:
+    return os.path.join(GLib.get_user_cache_dir(), 'driveicon', 'menu.json')
+
+
+def load_menu_snapshot(path: str | None = None) -> dict | None:
+    """Returns the last saved menu snapshot, or None if it is missing or unusable."""
+    try:
+        with open(path or default_snapshot_path(), encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != _SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def save_menu_snapshot(snapshot: dict, path: str | None = None) -> None:
+    path = path or default_snapshot_path()
+    contents = json.dumps(snapshot | {'version': _SNAPSHOT_VERSION}, separators=(',', ':'))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        GLib.file_set_contents(path, contents.encode())
+    except (OSError, GLib.Error):
+        pass
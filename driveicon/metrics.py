@@ -0,0 +1,75 @@
+from bisect import bisect_left
+from typing import Callable
+
+from dasbus.connection import MessageBus
+from dasbus.server.interface import dbus_interface
+from dasbus.server.template import InterfaceTemplate
+from dasbus.typing import Str, UInt64, Dict
+
+
+_BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """Counts durations into fixed millisecond buckets."""
+
+    def __init__(self) -> None:
+        self.__buckets = [0] * (len(_BUCKET_BOUNDS_MS) + 1)
+        self.__sum_us = 0
+
+    def observe(self, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        self.__buckets[bisect_left(_BUCKET_BOUNDS_MS, milliseconds)] += 1
+        self.__sum_us += round(seconds * 1_000_000)
+
+    def as_metrics(self, prefix: str) -> dict[str, int]:
+        metrics = {f'{prefix}.count': sum(self.__buckets), f'{prefix}.sum_us': self.__sum_us}
+        for bound, count in zip(_BUCKET_BOUNDS_MS, self.__buckets):
+            metrics[f'{prefix}.le_{bound}ms'] = count
+        metrics[f'{prefix}.le_inf'] = self.__buckets[-1]
+        return metrics
+
+
+@dbus_interface('one.markle.DriveIcon.Metrics')
+class _MetricsInterface(InterfaceTemplate):
+    def Snapshot(self) -> Dict[Str, UInt64]:
+        return self.implementation.snapshot()
+
+    def Reset(self) -> None:
+        self.implementation.reset()
+
+
+class MetricsService:
+    """Publishes counters gathered from `sources` on the bus.
+
+    Every source returns monotonically increasing counters keyed by dotted
+    names. `Reset` records the current values as a baseline that later
+    snapshots are reported against, so the sources themselves never need to
+    be reset.
+    """
+
+    def __init__(
+            self,
+            bus: MessageBus,
+            sources: list[Callable[[], dict[str, int]]],
+            object_path = '/one/markle/DriveIcon/Metrics',
+    ) -> None:
+        self.__sources = sources
+        self.__baseline: dict[str, int] = {}
+        self.__interface = _MetricsInterface(self)
+        bus.publish_object(object_path, self.__interface)
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            name: max(value - self.__baseline.get(name, 0), 0)
+            for name, value in sorted(self.__collect().items())
+        }
+
+    def reset(self) -> None:
+        self.__baseline = self.__collect()
+
+    def __collect(self) -> dict[str, int]:
+        metrics = {}
+        for source in self.__sources:
+            metrics |= source()
+        return metrics
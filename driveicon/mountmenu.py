@@ -1,14 +1,76 @@
+import asyncio
+import hashlib
+import sys
+import time
+import weakref
+from collections import Counter
 from functools import partial
+from itertools import chain
 from gi.repository import GObject
-from typing import Mapping
+from typing import Callable, Iterable, Mapping, NamedTuple
 
-from gi.repository import Gio, GLib, Gtk, Gdk
+from gi.repository import Gio, GLib
+
+from .devicequeue import DeviceOperationQueue
+from .fsinfo import FilesystemInfoCache, FilesystemUsage
+from .metrics import LatencyHistogram
+from .scheduler import CoalescingScheduler
+
+
+_Device = Gio.Drive | Gio.Volume | Gio.Mount
+
+
+class _ItemSpec(NamedTuple):
+    label: str | None
+    action: str | None = None
+    icon: tuple[str, ...] | str | Gio.Icon | None = None
+    is_section: bool = False
+    children: tuple['_ItemSpec', ...] | None = None
+
+
+class _Entry(NamedTuple):
+    spec: _ItemSpec
+    members: tuple[str, ...]
+    actions: tuple[tuple[str, str, str], ...]
+    usage: tuple[tuple[str, FilesystemUsage], ...] = ()
+
+
+class DeviceOperationOutcome(NamedTuple):
+    device_name: str
+    error: BaseException | None
+    latency: float
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+class BulkOperationResult(NamedTuple):
+    verb: str
+    outcomes: tuple[DeviceOperationOutcome, ...]
+
+    @property
+    def succeeded(self) -> tuple[DeviceOperationOutcome, ...]:
+        return tuple(outcome for outcome in self.outcomes if outcome.succeeded)
+
+    @property
+    def failed(self) -> tuple[DeviceOperationOutcome, ...]:
+        return tuple(outcome for outcome in self.outcomes if not outcome.succeeded)
+
+
+class _MenuState:
+    __slots__ = ('menu', 'specs', 'links')
+
+    def __init__(self, menu: Gio.Menu) -> None:
+        self.menu = menu
+        self.specs: list[_ItemSpec] = []
+        self.links: list[_MenuState | None] = []
 
 
 def _create_item(
         label: str | None,
         detailed_action: str | None = None,
-        icon: Gio.Icon | list[str] | None = None,
+        icon: Gio.Icon | list[str] | str | None = None,
         submenu: Gio.Menu | None = None,
         section: Gio.Menu | None = None,
 ) -> Gio.MenuItem:
@@ -22,6 +84,8 @@ def _create_item(
     match icon:
         case None:
             pass
+        case str():
+            item.set_icon(Gio.Icon.new_for_string(icon))
         case [*_]:
             item.set_icon(Gio.ThemedIcon(names=icon))
         case _:
@@ -30,17 +94,223 @@ def _create_item(
     return item
 
 
+def _device_identity(device: _Device) -> str:
+    match device:
+        case Gio.Drive():
+            kind = 'drive'
+            candidates = [device.get_identifier(Gio.DRIVE_IDENTIFIER_KIND_UNIX_DEVICE)]
+        case Gio.Volume():
+            kind = 'volume'
+            activation_root = device.get_activation_root()
+            # Sticks cloned on a duplicator share their filesystem UUID, so the
+            # device node, which no two live volumes share, is part of the key.
+            candidates = [
+                ':'.join(filter(None, [
+                    device.get_identifier(Gio.VOLUME_IDENTIFIER_KIND_UNIX_DEVICE),
+                    device.get_uuid(),
+                ])),
+                activation_root.get_uri() if activation_root is not None else None,
+            ]
+        case _:
+            kind = 'mount'
+            candidates = [device.get_root().get_uri()]
+
+    identity = next(filter(None, candidates), None) or device.get_name()
+    return hashlib.blake2b(f'{kind}:{identity}'.encode(), digest_size=8).hexdigest()
+
+
+def _action_name(verb: str, key: str) -> str:
+    return f'{verb}-{key}'
+
+
+def _icon_key(icon: Gio.Icon | None) -> str | Gio.Icon | None:
+    if icon is None:
+        return None
+    return icon.to_string() or icon
+
+
+def _spec_to_data(spec: _ItemSpec) -> list:
+    match spec.icon:
+        case str():
+            icon = spec.icon
+        case tuple():
+            icon = list(spec.icon)
+        case _:
+            icon = None
+    children = [_spec_to_data(child) for child in spec.children] if spec.children is not None else None
+    return [spec.label, spec.action, icon, spec.is_section, children]
+
+
+def _spec_from_data(data: list) -> _ItemSpec:
+    label, action, icon, is_section, children = data
+    return _ItemSpec(
+        label,
+        action,
+        tuple(icon) if isinstance(icon, list) else icon,
+        bool(is_section),
+        tuple(map(_spec_from_data, children)) if children is not None else None,
+    )
+
+
+def _without_usage(spec: _ItemSpec, labels: Mapping[str, str]) -> _ItemSpec:
+    children = tuple(_without_usage(child, labels) for child in spec.children) if spec.children is not None else None
+    return spec._replace(label=labels.get(spec.label, spec.label), children=children)
+
+
+def _with_bulk_section(specs: list[_ItemSpec]) -> list[_ItemSpec]:
+    if not specs:
+        return specs
+    return specs + [_ItemSpec(None, is_section=True, children=(
+        _ItemSpec('Eject all', 'eject-all', _EJECT_ICON),
+        _ItemSpec('Unmount all', 'unmount-all', _UNMOUNT_ICON),
+    ))]
+
+
+def _build_item(spec: _ItemSpec) -> tuple[Gio.MenuItem, _MenuState | None]:
+    if spec.children is None:
+        return _create_item(spec.label, spec.action, spec.icon), None
+
+    state = _MenuState(Gio.Menu())
+    _patch_menu(state, spec.children)
+    item = _create_item(
+        spec.label,
+        spec.action,
+        spec.icon,
+        submenu=state.menu if not spec.is_section else None,
+        section=state.menu if spec.is_section else None,
+    )
+    return item, state
+
+
+def _patch_menu(state: _MenuState, specs: tuple[_ItemSpec, ...] | list[_ItemSpec]) -> bool:
+    old = state.specs
+    specs = list(specs)
+    if old == specs:
+        return False
+
+    start = 0
+    limit = min(len(old), len(specs))
+    while start < limit and old[start] == specs[start]:
+        start += 1
+
+    old_end, new_end = len(old), len(specs)
+    while old_end > start and new_end > start and old[old_end - 1] == specs[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+
+    common = min(old_end, new_end) - start
+    for position in range(start, start + common):
+        old_spec, new_spec = old[position], specs[position]
+        link = state.links[position]
+        if old_spec[:4] == new_spec[:4] and link is not None and new_spec.children is not None:
+            _patch_menu(link, new_spec.children)
+        else:
+            item, link = _build_item(new_spec)
+            state.menu.remove(position)
+            state.menu.insert_item(position, item)
+            state.links[position] = link
+        state.specs[position] = new_spec
+
+    position = start + common
+    for _ in range(old_end - start - common):
+        state.menu.remove(position)
+        del state.specs[position]
+        del state.links[position]
+
+    for new_spec in specs[position:new_end]:
+        item, link = _build_item(new_spec)
+        state.menu.insert_item(position, item)
+        state.specs.insert(position, new_spec)
+        state.links.insert(position, link)
+        position += 1
+
+    return True
+
+
+_OPERATION_VERBS = ('mount', 'unmount', 'eject')
+
+_BULK_VERBS = ('eject', 'unmount')
+
+_EJECT_ICON = ('media-eject',)
+_OPEN_ICON = ('document-open-folder', 'document-open')
+_MOUNT_ICON = ('media-mount',)
+_UNMOUNT_ICON = ('media-eject',)
+
+
 class MountMenu(GObject.Object):
-    def __init__(self, application: Gtk.Application):
+    def __init__(
+            self,
+            *,
+            volume_monitor: Gio.VolumeMonitor | None = None,
+            volume_monitor_ready: asyncio.Future | None = None,
+            mount_operation: Gio.MountOperation | None = None,
+            launch_context: Callable[[], Gio.AppLaunchContext] = Gio.AppLaunchContext,
+            rebuild_delay_ms = 50,
+            rebuild_max_latency_ms = 300,
+            operation_timeout: float | None = 120,
+            open_timeout: float | None = 30,
+            bulk_concurrency = 4,
+            filesystem_info_ttl: float = 30,
+            filesystem_info_concurrency = 2,
+            filesystem_info_timeout: float | None = 10,
+            snapshot: Mapping | None = None,
+    ):
         super().__init__()
 
-        self.__volume_monitor: Gio.VolumeMonitor = Gio.VolumeMonitor.get()
+        self.__volume_monitor: Gio.VolumeMonitor | None = volume_monitor
         self.__action_group = Gio.SimpleActionGroup()
         self.__menu = Gio.Menu()
-        self.__mount_operation = Gtk.MountOperation(parent=Gtk.ApplicationWindow(
-            application=application
-        ))
-        self.__action_items: dict[int, Gio.Drive | Gio.Volume | Gio.Mount] = {}
+        self.__menu_state = _MenuState(self.__menu)
+        self.__mount_operation = mount_operation if mount_operation is not None else Gio.MountOperation()
+        self.__launch_context = launch_context
+        self.__keys: weakref.WeakKeyDictionary[_Device, str] = weakref.WeakKeyDictionary()
+        self.__devices: dict[str, weakref.ref[_Device]] = {}
+        self.__entries: dict[str, _Entry] = {}
+        self.__owners: dict[str, str] = {}
+        self.__actions: dict[str, tuple[str, str]] = {}
+        self.__in_flight: dict[tuple[str, str], asyncio.Future] = {}
+        self.__busy: dict[str, int] = {}
+        self.__operations = DeviceOperationQueue()
+        self.__operation_timeout = operation_timeout
+        self.__open_timeout = open_timeout
+        self.__opening: dict[str, asyncio.Future] = {}
+        self.__bulk_concurrency = bulk_concurrency
+        self.__bulk_operations: dict[str, asyncio.Task] = {}
+        self.__rebuild_scheduler = CoalescingScheduler(
+            self.__update_menu,
+            delay_ms=rebuild_delay_ms,
+            max_latency_ms=rebuild_max_latency_ms,
+        )
+        self.__filesystem_info = FilesystemInfoCache(
+            self.__on_filesystem_info_changed,
+            ttl=filesystem_info_ttl,
+            concurrency=filesystem_info_concurrency,
+            timeout=filesystem_info_timeout,
+        )
+        self.__usage: list[tuple[str, FilesystemUsage]] = []
+        self.__signal_counts = Counter()
+        self.__rebuild_latency = LatencyHistogram()
+        self.__operation_latency = {verb: LatencyHistogram() for verb in (*_OPERATION_VERBS, 'open')}
+        self.__operation_failures = Counter()
+
+        for verb in _BULK_VERBS:
+            action = Gio.SimpleAction(name=f'{verb}-all')
+            action.connect('activate', partial(self.__on_bulk_action_activated, verb))
+            self.__action_group.add_action(action)
+
+        # Until the monitor has its devices, the menu would come out empty;
+        # keep whatever the snapshot restored instead.
+        restored = snapshot is not None and self.__restore_snapshot(snapshot)
+        if volume_monitor_ready is not None:
+            volume_monitor_ready.add_done_callback(lambda _: self.__start())
+        elif restored:
+            GLib.idle_add(self.__start)
+        else:
+            self.__start()
+
+    def __start(self) -> bool:
+        if self.__volume_monitor is None:
+            self.__volume_monitor = Gio.VolumeMonitor.get()
 
         for signal_name in [
             'drive-changed',
@@ -53,24 +323,20 @@ class MountMenu(GObject.Object):
             'volume-changed',
             'volume-removed'
         ]:
-            self.__volume_monitor.connect(signal_name, self.__rebuild_menu)
-
-        actions = [
-            ('mount', self.__mount),
-            ('unmount', self.__unmount),
-            ('open', self.__open),
-            ('eject', self.__eject),
-        ]
-        for name, callback in actions:
-            action = Gio.SimpleAction(
-                name=name,
-                parameter_type=GLib.VariantType.new('s')
-            )
-            action.connect('activate', callback)
+            self.__volume_monitor.connect(signal_name, self.__on_volume_monitor_changed, signal_name)
 
-            self.__action_group.add_action(action)
+        self.__update_menu([])
+        return GLib.SOURCE_REMOVE
 
-        self.__rebuild_menu()
+    def __restore_snapshot(self, snapshot: Mapping) -> bool:
+        try:
+            specs = [_spec_from_data(entry['spec']) for entry in snapshot['entries']]
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        _patch_menu(self.__menu_state, _with_bulk_section(specs))
+        self.__update_bulk_actions()
+        return True
 
     @property
     def menu(self) -> Gio.Menu:
@@ -80,109 +346,437 @@ class MountMenu(GObject.Object):
     def action_group(self):
         return self.__action_group
 
-    @GObject.Signal('menu-changed')
-    def menu_changed(self, menu: Gio.Menu) -> None:
-        pass
+    def snapshot(self) -> dict:
+        """Returns the menu as JSON-compatible data for a later `snapshot=`.
 
-    def __rebuild_menu(self, *_):
-        def eject_item(obj):
-            return _create_item('Eject', f'eject::{id(obj)}', ['media-eject'])
+        Free space is left out of the labels, since it is stale by the time
+        the snapshot is restored.
+        """
+        entries = []
+        for key, entry in self.__entries.items():
+            labels = {f'{name} ({usage.describe()})': name for name, usage in entry.usage}
+            entries.append({'key': key, 'spec': _spec_to_data(_without_usage(entry.spec, labels))})
+        return {'entries': entries}
 
-        def open_item(obj):
-            return _create_item('Open', f'open::{id(obj)}', ['document-open-folder', 'document-open'])
+    @property
+    def filesystem_usage(self) -> list[tuple[str, FilesystemUsage]]:
+        return list(self.__usage)
 
-        def mount_item(obj):
-            return _create_item('Mount', f'mount::{id(obj)}', ['media-mount'])
+    @property
+    def rebuild_stats(self) -> dict[str, int]:
+        return self.__rebuild_scheduler.stats
 
-        def unmount_item(obj):
-            return _create_item('Unmount', f'unmount::{id(obj)}', ['media-eject'])
-
-        def menu_item(obj, menu, is_submenu=True):
-            item = _create_item(
-                obj.get_name(),
-                icon=obj.get_icon(),
-                submenu=menu if is_submenu else None,
-                section=menu if not is_submenu else None,
-            )
-            return item
+    @property
+    def metrics(self) -> dict[str, int]:
+        metrics = {f'volume_monitor.signals.{name}': count for name, count in self.__signal_counts.items()}
+        metrics |= {f'menu.rebuild_requests.{name}': count for name, count in self.rebuild_stats.items()}
+        metrics |= self.__rebuild_latency.as_metrics('menu.rebuild')
+        for verb, histogram in self.__operation_latency.items():
+            metrics |= histogram.as_metrics(f'operations.{verb}')
+            metrics[f'operations.{verb}.failures'] = self.__operation_failures[verb]
+        return metrics
+
+    @GObject.Signal('menu-changed')
+    def menu_changed(self, menu: Gio.Menu) -> None:
+        pass
 
-        def add_mount_items(menu, mount, is_toplevel = False):
-            self.__action_items[id(mount)] = mount
+    @GObject.Signal('bulk-operation-finished')
+    def bulk_operation_finished(self, result: object) -> None:
+        pass
 
-            if is_toplevel and mount.can_eject():
-                menu.append_item(eject_item(mount))
+    def eject_all(self) -> asyncio.Future[BulkOperationResult]:
+        return self.__run_bulk_operation('eject')
 
-            menu.append_item(open_item(mount))
-            if mount.can_unmount():
-                menu.append_item(unmount_item(mount))
+    def unmount_all(self) -> asyncio.Future[BulkOperationResult]:
+        return self.__run_bulk_operation('unmount')
 
-        def add_volume_items(menu, volume, is_toplevel = False):
-            self.__action_items[id(volume)] = volume
+    def __on_volume_monitor_changed(self, _, device: _Device, signal_name: str):
+        self.__signal_counts[signal_name] += 1
+        self.__rebuild_scheduler.schedule((signal_name, device))
 
-            if is_toplevel and volume.can_eject():
-                menu.append_item(eject_item(volume))
+    def __on_filesystem_info_changed(self, key: str):
+        self.__rebuild_scheduler.schedule(('filesystem-info-changed', key))
 
-            if is_toplevel:
-                section = menu
-            else:
-                section = Gio.Menu()
-                menu.append_item(menu_item(volume, section, False))
+    def __collect_toplevel_devices(self) -> list[_Device]:
+        devices = []
+        claimed = set()
 
+        def claim_volume(volume):
+            claimed.add(volume)
             if (mount := volume.get_mount()) is not None:
-                add_mount_items(section, mount)
-            elif volume.can_mount():
-                section.append_item(mount_item(volume))
-
-        self.__menu.remove_all()
-        self.__action_items.clear()
+                claimed.add(mount)
 
         for drive in self.__volume_monitor.get_connected_drives():
             if not drive.is_removable():
                 continue
 
-            self.__action_items[id(drive)] = drive
-            submenu = Gio.Menu()
-            self.__menu.append_item(menu_item(drive, submenu))
-
-            if drive.can_eject():
-                submenu.append_item(eject_item(drive))
-
+            devices.append(drive)
             for volume in drive.get_volumes():
-                add_volume_items(submenu, volume)
+                claim_volume(volume)
 
         for volume in self.__volume_monitor.get_volumes():
-            if id(volume) in self.__action_items:
+            if volume in claimed:
                 continue
 
-            submenu = Gio.Menu()
-            self.__menu.append_item(menu_item(volume, submenu))
-            add_volume_items(submenu, volume, True)
+            devices.append(volume)
+            claim_volume(volume)
 
         for mount in self.__volume_monitor.get_mounts():
-            if mount.is_shadowed() or id(mount) in self.__action_items:
+            if mount.is_shadowed() or mount in claimed:
                 continue
 
-            submenu = Gio.Menu()
-            self.__menu.append_item(menu_item(mount, submenu))
-            add_mount_items(submenu, mount, True)
+            devices.append(mount)
 
-        self.emit('menu-changed', self.__menu)
+        return devices
 
-    def __mount(self, _, id: GLib.Variant):
-        self.__action_items[int(id.get_string())].mount_asyncio(Gio.MountMountFlags.NONE, self.__mount_operation)
+    def __describe_entry(self, device: _Device) -> _Entry:
+        members = [device]
+        actions = []
+        usage = []
 
-    def __unmount(self, _, id: GLib.Variant):
-        self.__action_items[int(id.get_string())].unmount_with_operation_asyncio(
-            Gio.MountUnmountFlags.NONE,
-            self.__mount_operation,
-        )
+        def action_item(label, verb, obj, icon):
+            key = self.__device_key(obj)
+            name = _action_name(verb, key)
+            actions.append((name, verb, key))
+            return _ItemSpec(label, name, icon)
+
+        def eject_item(obj):
+            return action_item('Eject', 'eject', obj, _EJECT_ICON)
+
+        def open_item(obj):
+            return action_item('Open', 'open', obj, _OPEN_ICON)
+
+        def mount_item(obj):
+            return action_item('Mount', 'mount', obj, _MOUNT_ICON)
+
+        def unmount_item(obj):
+            return action_item('Unmount', 'unmount', obj, _UNMOUNT_ICON)
+
+        def label(obj):
+            if isinstance(obj, Gio.Mount):
+                mount = obj
+            elif isinstance(obj, Gio.Volume):
+                mount = obj.get_mount()
+            else:
+                mount = None
+
+            name = obj.get_name()
+            if mount is None:
+                return name
 
-    def __open(self, _, id: GLib.Variant):
-        uri = self.__action_items[int(id.get_string())].get_default_location().get_uri()
-        Gtk.show_uri(None, uri, Gdk.CURRENT_TIME)
+            mount_usage = self.__filesystem_info.lookup(self.__device_key(mount), mount.get_root())
+            if mount_usage is None:
+                return name
 
-    def __eject(self, _, id: GLib.Variant):
-        self.__action_items[int(id.get_string())].eject_with_operation_asyncio(
-            Gio.MountUnmountFlags.NONE,
-            self.__mount_operation,
+            usage.append((name, mount_usage))
+            return f'{name} ({mount_usage.describe()})'
+
+        def menu_item(obj, children, is_submenu=True):
+            return _ItemSpec(
+                label(obj),
+                icon=_icon_key(obj.get_icon()),
+                is_section=not is_submenu,
+                children=tuple(children),
+            )
+
+        def mount_items(mount, is_toplevel = False):
+            if is_toplevel and mount.can_eject():
+                yield eject_item(mount)
+
+            yield open_item(mount)
+            if mount.can_unmount():
+                yield unmount_item(mount)
+
+        def volume_items(volume, is_toplevel = False):
+            if is_toplevel and volume.can_eject():
+                yield eject_item(volume)
+
+            if (mount := volume.get_mount()) is not None:
+                members.append(mount)
+                section = mount_items(mount)
+            elif volume.can_mount():
+                section = [mount_item(volume)]
+            else:
+                section = []
+
+            if is_toplevel:
+                yield from section
+            else:
+                yield menu_item(volume, section, False)
+
+        def drive_items(drive):
+            if drive.can_eject():
+                yield eject_item(drive)
+
+            for volume in drive.get_volumes():
+                members.append(volume)
+                yield from volume_items(volume)
+
+        if isinstance(device, Gio.Drive):
+            children = drive_items(device)
+        elif isinstance(device, Gio.Volume):
+            children = volume_items(device, True)
+        else:
+            children = mount_items(device, True)
+
+        spec = menu_item(device, children)
+        return _Entry(spec, tuple(map(self.__device_key, members)), tuple(actions), tuple(usage))
+
+    def __device_key(self, device: _Device) -> str:
+        if (key := self.__keys.get(device)) is not None:
+            return key
+
+        key = self.__keys[device] = _device_identity(device)
+        self.__devices[key] = weakref.ref(device)
+        return key
+
+    def __resolve(self, key: str) -> _Device | None:
+        if key not in self.__owners:
+            return None
+
+        if (ref := self.__devices.get(key)) is not None and (device := ref()) is not None:
+            return device
+
+        for device in chain(
+                self.__volume_monitor.get_connected_drives(),
+                self.__volume_monitor.get_volumes(),
+                self.__volume_monitor.get_mounts(),
+        ):
+            if self.__device_key(device) == key:
+                return device
+        return None
+
+    def __affected_entries(self, device: _Device) -> Iterable[str]:
+        related = [device]
+        if isinstance(device, Gio.Mount):
+            related += [device.get_volume(), device.get_drive()]
+        elif isinstance(device, Gio.Volume):
+            related.append(device.get_drive())
+
+        for obj in related:
+            if obj is not None and (owner := self.__owners.get(self.__device_key(obj))) is not None:
+                yield owner
+
+    def __update_menu(self, changes: list[tuple[str, _Device]]):
+        started = time.perf_counter()
+        dirty = set()
+        for signal_name, device in changes:
+            if signal_name == 'filesystem-info-changed':
+                dirty.add(self.__owners.get(device))
+            else:
+                dirty.update(self.__affected_entries(device))
+
+        entries = {}
+        stale_actions = set()
+        adopted_actions = set()
+        for device in self.__collect_toplevel_devices():
+            key = self.__device_key(device)
+            entry = self.__entries.get(key)
+            if entry is None or key in dirty:
+                if entry is not None:
+                    self.__forget_entry(key, entry)
+                    stale_actions.update(name for name, *_ in entry.actions)
+                entry = self.__describe_entry(device)
+                self.__adopt_entry(key, entry)
+                adopted_actions.update(name for name, *_ in entry.actions)
+            entries[key] = entry
+
+        for key in self.__entries.keys() - entries.keys():
+            entry = self.__entries[key]
+            self.__forget_entry(key, entry)
+            stale_actions.update(name for name, *_ in entry.actions)
+        self.__entries = entries
+
+        for key in self.__devices.keys() - self.__owners.keys():
+            del self.__devices[key]
+        self.__filesystem_info.retain(self.__owners.keys())
+        self.__usage = [item for entry in entries.values() for item in entry.usage]
+
+        specs = _with_bulk_section([entry.spec for entry in entries.values()])
+        changed = _patch_menu(self.__menu_state, specs)
+        self.__update_bulk_actions()
+
+        for name in stale_actions - adopted_actions:
+            del self.__actions[name]
+            self.__action_group.remove_action(name)
+
+        self.__rebuild_latency.observe(time.perf_counter() - started)
+        if changed:
+            self.emit('menu-changed', self.__menu)
+
+    def __adopt_entry(self, key: str, entry: _Entry):
+        for member in entry.members:
+            self.__owners[member] = key
+
+        for name, verb, member in entry.actions:
+            if name in self.__actions:
+                continue
+
+            action = Gio.SimpleAction(name=name)
+            action.connect('activate', partial(self.__on_action_activated, verb, member))
+            if verb in _OPERATION_VERBS:
+                action.set_enabled(member not in self.__busy)
+            self.__action_group.add_action(action)
+            self.__actions[name] = verb, member
+
+    def __forget_entry(self, key: str, entry: _Entry):
+        for member in entry.members:
+            if self.__owners.get(member) == key:
+                del self.__owners[member]
+
+    def __on_action_activated(self, verb: str, key: str, *_):
+        if (device := self.__resolve(key)) is None:
+            return
+
+        if verb == 'open':
+            self.__open(device)
+        else:
+            self.__run_operation(verb, device)
+
+    def __set_busy(self, key: str, busy: bool):
+        count = self.__busy.get(key, 0) + (1 if busy else -1)
+        if count > 0:
+            self.__busy[key] = count
+        else:
+            self.__busy.pop(key, None)
+
+        for verb in _OPERATION_VERBS:
+            if (action := self.__action_group.lookup_action(_action_name(verb, key))) is not None:
+                action.set_enabled(count <= 0)
+
+    def __device_queue_key(self, device: _Device) -> str:
+        if isinstance(device, Gio.Mount):
+            device = device.get_drive() or device.get_volume() or device
+        elif isinstance(device, Gio.Volume):
+            device = device.get_drive() or device
+        return self.__device_key(device)
+
+    def __run_operation(self, verb: str, device: _Device) -> asyncio.Future:
+        key = self.__device_key(device)
+        if (future := self.__in_flight.get((verb, key))) is not None:
+            return future
+
+        match verb:
+            case 'mount':
+                operation = partial(device.mount_asyncio, Gio.MountMountFlags.NONE, self.__mount_operation)
+            case 'unmount':
+                operation = partial(
+                    device.unmount_with_operation_asyncio,
+                    Gio.MountUnmountFlags.NONE,
+                    self.__mount_operation,
+                )
+            case 'eject':
+                operation = partial(
+                    device.eject_with_operation_asyncio,
+                    Gio.MountUnmountFlags.NONE,
+                    self.__mount_operation,
+                )
+            case _:
+                raise ValueError(f'unknown operation {verb}')
+
+        future = self.__operations.submit(
+            self.__device_queue_key(device),
+            partial(operation, timeout=self.__operation_timeout),
         )
+        self.__in_flight[verb, key] = future
+        self.__set_busy(key, True)
+        future.add_done_callback(partial(
+            self.__on_operation_done,
+            verb,
+            key,
+            device.get_name(),
+            time.perf_counter(),
+        ))
+        return future
+
+    def __on_operation_done(self, verb: str, key: str, name: str, started: float, future: asyncio.Future):
+        del self.__in_flight[verb, key]
+        self.__set_busy(key, False)
+        self.__record_operation(verb, name, started, future)
+
+    def __bulk_targets(self, verb: str) -> list[str]:
+        targets = []
+        for entry in self.__entries.values():
+            for _, action_verb, key in entry.actions:
+                if action_verb != verb:
+                    continue
+                targets.append(key)
+                if verb == 'eject':
+                    break
+        return targets
+
+    def __update_bulk_actions(self):
+        for verb in _BULK_VERBS:
+            action = self.__action_group.lookup_action(f'{verb}-all')
+            action.set_enabled(verb not in self.__bulk_operations and len(self.__bulk_targets(verb)) > 0)
+
+    def __on_bulk_action_activated(self, verb: str, *_):
+        self.__run_bulk_operation(verb)
+
+    def __run_bulk_operation(self, verb: str) -> asyncio.Future[BulkOperationResult]:
+        if (task := self.__bulk_operations.get(verb)) is not None:
+            return task
+
+        task = asyncio.ensure_future(self.__bulk_operation(verb, self.__bulk_targets(verb)))
+        self.__bulk_operations[verb] = task
+        task.add_done_callback(partial(self.__on_bulk_operation_done, verb))
+        self.__update_bulk_actions()
+        return task
+
+    async def __bulk_operation(self, verb: str, keys: list[str]) -> BulkOperationResult:
+        semaphore = asyncio.Semaphore(self.__bulk_concurrency)
+
+        async def run(device):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await self.__run_operation(verb, device)
+                    error = None
+                except Exception as e:
+                    error = e
+                return DeviceOperationOutcome(device.get_name(), error, time.perf_counter() - started)
+
+        devices = filter(None, map(self.__resolve, keys))
+        outcomes = await asyncio.gather(*map(run, devices))
+        return BulkOperationResult(verb, tuple(outcomes))
+
+    def __on_bulk_operation_done(self, verb: str, task: asyncio.Task):
+        del self.__bulk_operations[verb]
+        self.__update_bulk_actions()
+        if not task.cancelled() and task.exception() is None:
+            self.emit('bulk-operation-finished', task.result())
+
+    def __open(self, device: _Device) -> asyncio.Future:
+        location = device.get_default_location()
+        uri = location.get_uri()
+        if (future := self.__opening.get(uri)) is not None:
+            return future
+
+        future = asyncio.ensure_future(self.__launch_default_handler(location))
+        self.__opening[uri] = future
+        future.add_done_callback(partial(self.__on_open_done, uri, device.get_name(), time.perf_counter()))
+        return future
+
+    async def __launch_default_handler(self, location: Gio.File):
+        app_info = await location.query_default_handler_asyncio(timeout=self.__open_timeout)
+        await app_info.launch_uris_asyncio(
+            [location.get_uri()],
+            self.__launch_context(),
+            timeout=self.__open_timeout,
+        )
+
+    def __on_open_done(self, uri: str, name: str, started: float, future: asyncio.Future):
+        del self.__opening[uri]
+        self.__record_operation('open', name, started, future)
+
+    def __record_operation(self, verb: str, name: str, started: float, future: asyncio.Future):
+        self.__operation_latency[verb].observe(time.perf_counter() - started)
+        if future.cancelled():
+            error = 'cancelled'
+        elif (exception := future.exception()) is not None:
+            error = exception.message if isinstance(exception, GLib.Error) else str(exception) or type(exception).__name__
+        else:
+            return
+
+        self.__operation_failures[verb] += 1
+        print(f'driveicon: {verb} {name!r} failed: {error}', file=sys.stderr)
@@ -0,0 +1,119 @@
+import hashlib
+from collections import OrderedDict
+
+from gi.repository import GLib, Gio, GdkPixbuf
+
+
+_DEFAULT_SIZES = (16, 22, 24, 32, 48)
+
+
+def _load_icon_data(icon: Gio.Icon) -> bytes | None:
+    match icon:
+        case Gio.BytesIcon():
+            return icon.get_bytes().get_data()
+        case Gio.FileIcon():
+            _, contents, _ = icon.get_file().load_contents(None)
+            return contents
+        case Gio.LoadableIcon():
+            stream, _ = icon.load(0, None)
+            chunks = []
+            while (chunk := stream.read_bytes(65536, None).get_data()):
+                chunks.append(chunk)
+            stream.close(None)
+            return b''.join(chunks)
+        case _:
+            return None
+
+
+def _pixbuf_to_argb32(pixbuf: GdkPixbuf.Pixbuf) -> bytes:
+    width, height = pixbuf.get_width(), pixbuf.get_height()
+    channels = pixbuf.get_n_channels()
+    stride = pixbuf.get_rowstride()
+    pixels = pixbuf.read_pixel_bytes().get_data()
+
+    row_size = width * channels
+    if stride != row_size:
+        pixels = b''.join(pixels[y * stride:y * stride + row_size] for y in range(height))
+
+    argb = bytearray(width * height * 4)
+    argb[0::4] = pixels[3::4] if pixbuf.get_has_alpha() else b'\xff' * (width * height)
+    argb[1::4] = pixels[0::channels]
+    argb[2::4] = pixels[1::channels]
+    argb[3::4] = pixels[2::channels]
+    return bytes(argb)
+
+
+class PixmapCache:
+    """Renders loadable icons and caches the results by the digest of their content.
+
+    Icons are keyed to a content digest, and rendered buffers are keyed by that
+    digest, so identical images reached through different `Gio.Icon` objects share
+    one buffer, and repeated reads return the very same `bytes` objects.
+    """
+
+    def __init__(self, sizes: tuple[int, ...] = _DEFAULT_SIZES, max_entries = 128) -> None:
+        self.__sizes = sizes
+        self.__max_entries = max_entries
+        self.__digests: OrderedDict[str, str | None] = OrderedDict()
+        self.__sources: OrderedDict[str, bytes] = OrderedDict()
+        self.__buffers: OrderedDict[tuple[str, int], object] = OrderedDict()
+
+    def pixmaps(self, icon: Gio.Icon | None) -> list[tuple[int, int, bytes]]:
+        if (digest := self.__digest(icon)) is None:
+            return []
+
+        def render():
+            pixmaps = []
+            for size in self.__sizes:
+                pixbuf = self.__decode(icon, digest, size)
+                pixmaps.append((pixbuf.get_width(), pixbuf.get_height(), _pixbuf_to_argb32(pixbuf)))
+            return pixmaps
+
+        return self.__cached(self.__buffers, (digest, 0), render)
+
+    def png(self, icon: Gio.Icon | None, size: int) -> bytes | None:
+        if (digest := self.__digest(icon)) is None:
+            return None
+
+        def render():
+            _, buffer = self.__decode(icon, digest, size).save_to_bufferv('png', [], [])
+            return buffer
+
+        return self.__cached(self.__buffers, (digest, size), render)
+
+    def __digest(self, icon: Gio.Icon | None) -> str | None:
+        if icon is None or isinstance(icon, Gio.ThemedIcon):
+            return None
+
+        key = icon.to_string()
+        if key is not None and key in self.__digests:
+            self.__digests.move_to_end(key)
+            return self.__digests[key]
+
+        try:
+            data = _load_icon_data(icon)
+        except GLib.Error:
+            data = None
+
+        digest = None
+        if data:
+            digest = hashlib.sha256(data).hexdigest()
+            self.__cached(self.__sources, digest, lambda: data)
+        if key is not None:
+            self.__cached(self.__digests, key, lambda: digest)
+        return digest
+
+    def __decode(self, icon: Gio.Icon, digest: str, size: int) -> GdkPixbuf.Pixbuf:
+        data = self.__cached(self.__sources, digest, lambda: _load_icon_data(icon))
+        stream = Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(data))
+        return GdkPixbuf.Pixbuf.new_from_stream_at_scale(stream, size, size, True, None)
+
+    def __cached(self, cache: OrderedDict, key, render):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        value = cache[key] = render()
+        while len(cache) > self.__max_entries:
+            cache.popitem(last=False)
+        return value
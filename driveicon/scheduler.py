@@ -0,0 +1,98 @@
+from typing import Callable, Hashable
+
+from gi.repository import GLib
+
+
+class CoalescingScheduler:
+    """Collapses bursts of requests into a single callback invocation.
+
+    Every call to `schedule` (re)arms a short debounce window; the callback runs
+    once the window elapses without new requests, or at the latest
+    `max_latency_ms` after the first pending request. A `delay_ms` of 0 flushes
+    on the next main-loop idle instead.
+    """
+
+    def __init__(
+            self,
+            callback: Callable[[list[Hashable]], None],
+            *,
+            delay_ms = 0,
+            max_latency_ms = 250,
+    ) -> None:
+        self.__callback = callback
+        self.__delay_ms = delay_ms
+        self.__max_latency_ms = max(max_latency_ms, delay_ms)
+        self.__pending: dict[Hashable, None] = {}
+        self.__delay_source: int | None = None
+        self.__deadline_source: int | None = None
+        self.__requests = 0
+        self.__merged = 0
+        self.__flushes = 0
+
+    @property
+    def pending(self) -> bool:
+        return self.__delay_source is not None
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'requests': self.__requests,
+            'merged': self.__merged,
+            'flushes': self.__flushes,
+        }
+
+    def schedule(self, key: Hashable = None) -> None:
+        self.__requests += 1
+        self.__pending[key] = None
+
+        if self.__delay_source is not None:
+            self.__merged += 1
+            if self.__delay_ms == 0:
+                return
+            GLib.source_remove(self.__delay_source)
+        else:
+            self.__deadline_source = GLib.timeout_add(self.__max_latency_ms, self.__on_deadline)
+
+        if self.__delay_ms == 0:
+            self.__delay_source = GLib.idle_add(self.__on_delay)
+        else:
+            self.__delay_source = GLib.timeout_add(self.__delay_ms, self.__on_delay)
+
+    def flush(self) -> None:
+        for source in (self.__delay_source, self.__deadline_source):
+            if source is not None:
+                GLib.source_remove(source)
+        self.__dispatch()
+
+    def cancel(self) -> None:
+        for source in (self.__delay_source, self.__deadline_source):
+            if source is not None:
+                GLib.source_remove(source)
+        self.__delay_source = None
+        self.__deadline_source = None
+        self.__pending.clear()
+
+    def __on_delay(self) -> bool:
+        self.__delay_source = None
+        if self.__deadline_source is not None:
+            GLib.source_remove(self.__deadline_source)
+        self.__dispatch()
+        return GLib.SOURCE_REMOVE
+
+    def __on_deadline(self) -> bool:
+        self.__deadline_source = None
+        if self.__delay_source is not None:
+            GLib.source_remove(self.__delay_source)
+        self.__dispatch()
+        return GLib.SOURCE_REMOVE
+
+    def __dispatch(self) -> None:
+        self.__delay_source = None
+        self.__deadline_source = None
+        if not self.__pending:
+            return
+
+        keys = list(self.__pending)
+        self.__pending.clear()
+        self.__flushes += 1
+        self.__callback(keys)
@@ -0,0 +1,39 @@
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, TextIO
+
+
+class StartupProfile:
+    def __init__(self) -> None:
+        self.__started = time.perf_counter()
+        self.__phases: list[tuple[str, float]] = []
+        self.__pending: dict[str, float] = {}
+
+    @property
+    def phases(self) -> list[tuple[str, float]]:
+        return list(self.__phases)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.__phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def begin(self, name: str) -> None:
+        self.__pending[name] = time.perf_counter()
+
+    def end(self, name: str) -> None:
+        if (started := self.__pending.pop(name, None)) is not None:
+            self.add(name, time.perf_counter() - started)
+
+    def report(self, file: TextIO = sys.stderr) -> None:
+        width = max((len(name) for name, _ in self.__phases), default=0)
+        for name, seconds in self.__phases:
+            print(f'{name:<{width}}  {seconds * 1000:9.2f} ms', file=file)
+        print(f'{"total":<{width}}  {(time.perf_counter() - self.__started) * 1000:9.2f} ms', file=file)
@@ -1,15 +1,19 @@
+import asyncio
 from enum import Enum
-from functools import partial
 from itertools import filterfalse, chain
-from typing import Iterable
 
-from gi.repository import GLib, GObject, Gio, Dbusmenu, Gtk, Gdk
-from dasbus.connection import SessionMessageBus
+from gi.repository import GLib, GObject, Gio
+from dasbus.connection import MessageBus, SessionMessageBus
 from dasbus.server.interface import dbus_interface, dbus_signal
 from dasbus.server.template import InterfaceTemplate
 from dasbus.identifier import DBusServiceIdentifier, DBusObjectIdentifier
 from dasbus.typing import Str, UInt32, Bool, Int, Byte, ObjPath, List, Tuple
 
+from .pixmap import PixmapCache
+from .dbusmenu import DBusMenuBackend
+from .iconresolver import ThemeIconResolver, NamedIconResolver
+from .scheduler import CoalescingScheduler
+
 
 class SNICategory(Enum):
     APPLICATION_STATUS = 'ApplicationStatus'
@@ -24,47 +28,12 @@ class SNIStatus(Enum):
     NEEDS_ATTENTION = 'NeedsAttention'
 
 
-class _DBusMenuItemType:
-    STANDARD = 'standard'
-    SEPARATOR = 'separator'
-
-
-class _DBusMenuItemToggleType:
-    CHECKMARK = 'checkmark'
-    RADIO = 'radio'
-    NONE = ''
-
-
-class _DBusMenuItemToggleState:
-    OFF = 0
-    ON = 1
-    INDETERMINATE = -1
-
-
-class _DBusMenuItemProperty:
-    TYPE = 'type'
-    LABEL = 'label'
-    ENABLED = 'enabled'
-    VISIBLE = 'visible'
-    ICON_NAME = 'icon-name'
-    ICON_DATA = 'icon-data'
-    SHORTCUT = 'shortcut'
-    TOGGLE_TYPE = 'toggle-type'
-    TOGGLE_STATE = 'toggle-state'
-    CHILDREN_DISPLAY = 'children-display'
-
-
-_VARIANT_TYPE_STRING = GLib.VariantType.new('s')
-_VARIANT_TYPE_BOOL = GLib.VariantType.new('b')
-
-_VARIANT_BOOL_TRUE = GLib.Variant.new_boolean(True)
-
-
 @dbus_interface('org.kde.StatusNotifierItem')
 class _TrayIconProxy(InterfaceTemplate):
-    def __init__(self, tray_icon: 'TrayIcon', object_path: str) -> None:
+    def __init__(self, tray_icon: 'TrayIcon', object_path: str, pixmap_cache: PixmapCache) -> None:
         super().__init__(tray_icon)
         self.__object_path = object_path
+        self.__pixmap_cache = pixmap_cache
 
     @property
     def Category(self) -> Str:
@@ -172,166 +141,26 @@ class _TrayIconProxy(InterfaceTemplate):
         else:
             return ''
 
-    @staticmethod
-    def __icon_pixmap(icon: Gio.Icon) -> List[Tuple[Int, Int, List[Byte]]]:
-        return []
-
-
-class _DBusMenuProxy:
-    def __init__(self, object_path: str, root_menu: Gio.MenuModel, action_group: Gio.ActionGroup) -> None:
-        self.__root_menu = root_menu
-        self.__action_group = action_group
-        self.__root_node = Dbusmenu.Menuitem()
-        self.__action_enabled_items: dict[str, list[Dbusmenu.Menuitem]] = {}
-        self.__action_state_items: dict[str, list[tuple[Dbusmenu.Menuitem, GLib.Variant]]] = {}
-        self.__items_changed_handlers: dict[Gio.MenuModel, int] = {}
-        self.__server = Dbusmenu.Server(
-            dbus_object=object_path,
-            root_node=self.__root_node
-        )
-        self.__icon_theme = Gtk.IconTheme.get_for_display(Gdk.Display.get_default())
+    def __icon_pixmap(self, icon: Gio.Icon | None) -> List[Tuple[Int, Int, List[Byte]]]:
+        return self.__pixmap_cache.pixmaps(icon)
 
-        self.__rebuild_menu()
-        self.__action_group.connect('action-state-changed', self.__on_action_state_changed)
-        self.__action_group.connect('action-enabled-changed', self.__on_action_enabled_changed)
 
-    def __build_dbus_menu_items(self, menu: Gio.MenuModel) -> Iterable[Dbusmenu.Menuitem]:
-        at_first_item = True
-        at_section_end = False
-
-        if menu not in self.__items_changed_handlers:
-            handler_id = menu.connect(
-                'items-changed',
-                partial(lambda self, *_: self.__rebuild_menu(), self),
-            )
-            self.__items_changed_handlers[menu] = handler_id
-
-        for i in range(menu.get_n_items()):
-            if (section := menu.get_item_link(i, Gio.MENU_LINK_SECTION)) is not None:
-                if not at_first_item:
-                    yield self.__build_separator()
-                if menu.get_item_attribute_value(i, Gio.MENU_ATTRIBUTE_LABEL) is not None:
-                    yield self.__build_dbus_menu_item(menu.iterate_item_attributes(i), is_section_header=True)
-                for item in self.__build_dbus_menu_items(section):
-                    yield item
-                at_section_end = True
-            else:
-                if at_section_end:
-                    yield self.__build_separator()
-                    at_section_end = False
-
-                yield self.__build_dbus_menu_item(
-                    menu.iterate_item_attributes(i),
-                    menu.get_item_link(i, Gio.MENU_LINK_SUBMENU),
-                )
+def _same_value(a, b) -> bool:
+    if isinstance(a, Gio.Icon) and isinstance(b, Gio.Icon):
+        return a.equal(b)
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(map(_same_value, a, b))
+    return a == b
 
-            at_first_item = False
 
-    def __build_dbus_menu_item(
-            self,
-            attrs: Gio.MenuAttributeIter,
-            submenu: Gio.MenuModel | None = None,
-            is_section_header = False,
-    ) -> Dbusmenu.Menuitem:
-        item = Dbusmenu.Menuitem()
-        action = None
-        target = None
-
-        def activate_action(action_group, action, target, *_):
-            action_group.activate_action(action, target)
-
-        for name, value in attrs:
-            match name:
-                case Gio.MENU_ATTRIBUTE_TARGET:
-                    target = value
-                case Gio.MENU_ATTRIBUTE_ACTION:
-                    action = value.get_string()
-                case Gio.MENU_ATTRIBUTE_LABEL:
-                    item.property_set(_DBusMenuItemProperty.LABEL, value.get_string())
-                case Gio.MENU_ATTRIBUTE_ICON:
-                    icon = Gio.Icon.deserialize(value)
-                    if isinstance(icon, Gio.ThemedIcon):
-                        if not self.__icon_theme.has_gicon(icon):
-                            continue
-
-                        icon_printable = self.__icon_theme.lookup_by_gicon(
-                            icon,
-                            24,
-                            1,
-                            Gtk.TextDirection.NONE,
-                            Gtk.IconLookupFlags.FORCE_SYMBOLIC,
-                        )
-                        item.property_set(_DBusMenuItemProperty.ICON_NAME, icon_printable.get_icon_name())
-                    else:
-                        raise ValueError(f'icon of type {type(icon)} is not supported')
-
-        if is_section_header:
-            item.property_set_bool(_DBusMenuItemProperty.ENABLED, False)
-            return item
-
-        if action is not None:
-            item.connect('item-activated', partial(activate_action, self.__action_group, action, target))
-
-            item.property_set_bool(_DBusMenuItemProperty.ENABLED, self.__action_group.get_action_enabled(action))
-            self.__action_enabled_items.setdefault(action, []).append(item)
-
-            state_type = self.__action_group.get_action_state_type(action)
-            if state_type == _VARIANT_TYPE_STRING or state_type == _VARIANT_TYPE_BOOL:
-                is_string = state_type == _VARIANT_TYPE_STRING
-                toggle_type = _DBusMenuItemToggleType.RADIO if is_string else _DBusMenuItemToggleType.CHECKMARK
-                expected_value = target if is_string else _VARIANT_BOOL_TRUE
-                current_value = self.__action_group.get_action_state(action)
-
-                item.property_set(_DBusMenuItemProperty.TOGGLE_TYPE, toggle_type)
-                item.property_set_int(
-                    _DBusMenuItemProperty.TOGGLE_STATE,
-                    _DBusMenuItemToggleState.ON if expected_value == current_value else _DBusMenuItemToggleState.OFF,
-                )
-                self.__action_state_items.setdefault(action, []).append((item, expected_value))
-
-        if submenu is not None:
-            submenu_is_empty = True
-            for submenu_item in self.__build_dbus_menu_items(submenu):
-                item.child_append(submenu_item)
-                submenu_is_empty = False
-            if not submenu_is_empty:
-                item.property_set(_DBusMenuItemProperty.CHILDREN_DISPLAY, 'submenu')
-
-        return item
-
-    def __rebuild_menu(self) -> None:
-        self.__action_state_items = {}
-        self.__action_enabled_items = {}
-
-        for model, handler_id in self.__items_changed_handlers.items():
-            model.disconnect(handler_id)
-        self.__items_changed_handlers.clear()
-
-        self.__root_node.take_children()
-        for item in self.__build_dbus_menu_items(self.__root_menu):
-            self.__root_node.child_append(item)
-
-    def __on_action_enabled_changed(self, _, name: str, enabled: bool) -> None:
-        for item in self.__action_enabled_items.get(name, []):
-            item.property_set_bool(_DBusMenuItemProperty.ENABLED, enabled)
-
-    def __on_action_state_changed(self, _, name: str, value: GLib.Variant) -> None:
-        for item, expected_value in self.__action_state_items.get(name, []):
-            item.property_set_int(
-                _DBusMenuItemProperty.TOGGLE_STATE,
-                _DBusMenuItemToggleState.ON if value == expected_value else _DBusMenuItemToggleState.OFF,
-            )
+_REGISTRATION_TIMEOUT_MS = 5000
+_REGISTRATION_INITIAL_DELAY = 0.5
+_REGISTRATION_MAX_DELAY = 30
 
-    @staticmethod
-    def __build_separator() -> Dbusmenu.Menuitem:
-        item = Dbusmenu.Menuitem()
-        item.property_set(_DBusMenuItemProperty.TYPE, _DBusMenuItemType.SEPARATOR)
-        return item
+_CHANGE_SIGNALS = ('NewTitle', 'NewStatus', 'NewIcon', 'NewOverlayIcon', 'NewAttentionIcon', 'NewToolTip')
 
 
 class TrayIcon(GObject.Object):
-    __bus = SessionMessageBus()
-    __watcher = DBusServiceIdentifier(__bus, ('org', 'kde', 'StatusNotifierWatcher'))
     __watcher_object = DBusObjectIdentifier(('StatusNotifierWatcher',))
 
     def __init__(
@@ -350,8 +179,15 @@ class TrayIcon(GObject.Object):
             action_group: Gio.SimpleActionGroup,
             menu_model: Gio.MenuModel,
             object_path='/SNIMenu',
+            menu_backend = DBusMenuBackend.LIBDBUSMENU,
+            lazy_menu = False,
+            lazy_menu_timeout = 30,
+            icon_resolver: ThemeIconResolver | NamedIconResolver | None = None,
+            bus: MessageBus | None = None,
     ) -> None:
         super().__init__()
+        self.__bus = bus if bus is not None else SessionMessageBus()
+        self.__watcher = DBusServiceIdentifier(self.__bus, ('org', 'kde', 'StatusNotifierWatcher'))
         self.__category = category
         self.__id = id
         self.__title = title
@@ -363,16 +199,48 @@ class TrayIcon(GObject.Object):
         self.__tooltip = tooltip
         self.__item_is_menu = item_is_menu
         self.__action_group = action_group
-        self.__interface = _TrayIconProxy(self, object_path)
-        self.__menu_proxy = _DBusMenuProxy(
-            object_path,
-            menu_model,
-            self.__action_group,
-        )
+        self.__pixmap_cache = PixmapCache()
+        self.__interface = _TrayIconProxy(self, object_path, self.__pixmap_cache)
+        icon_resolver = icon_resolver if icon_resolver is not None else NamedIconResolver()
+        self.__emitted = {signal: self.__signal_value(signal) for signal in _CHANGE_SIGNALS}
+        self.__signal_counts = {signal: {'requested': 0, 'emitted': 0} for signal in self.__emitted}
+        self.__signal_scheduler = CoalescingScheduler(self.__emit_signals)
+        if menu_backend == DBusMenuBackend.NATIVE:
+            from .dbusmenu import _NativeDBusMenuProxy
+            self.__menu_proxy = _NativeDBusMenuProxy(
+                self.__bus,
+                object_path,
+                menu_model,
+                self.__action_group,
+                self.__pixmap_cache,
+                icon_resolver,
+            )
+        else:
+            from .libdbusmenu import _DBusMenuProxy
+            self.__menu_proxy = _DBusMenuProxy(
+                object_path,
+                menu_model,
+                self.__action_group,
+                self.__pixmap_cache,
+                icon_resolver,
+                lazy_submenus=lazy_menu,
+                lazy_idle_timeout=lazy_menu_timeout,
+            )
+
+        self.__object_path = object_path
+        self.__registration: asyncio.Task | None = None
 
         self.__bus.publish_object(object_path, self.__interface)
-        proxy = self.__watcher.get_proxy(self.__watcher_object)
-        proxy.RegisterStatusNotifierItem(object_path)
+        self.__bus.connection.signal_subscribe(
+            'org.freedesktop.DBus',
+            'org.freedesktop.DBus',
+            'NameOwnerChanged',
+            '/org/freedesktop/DBus',
+            self.__watcher.service_name,
+            Gio.DBusSignalFlags.NONE,
+            self.__on_watcher_owner_changed,
+        )
+        self.__register()
 
     @property
     def category(self) -> str:
@@ -389,7 +257,7 @@ class TrayIcon(GObject.Object):
     @title.setter
     def title(self, title: str) -> None:
         self.__title = title
-        self.__interface.NewTitle.emit()
+        self.__schedule_signal('NewTitle')
 
     @property
     def status(self) -> str:
@@ -398,7 +266,7 @@ class TrayIcon(GObject.Object):
     @status.setter
     def status(self, status: SNIStatus) -> None:
         self.__status = status
-        self.__interface.NewStatus.emit(status.value)
+        self.__schedule_signal('NewStatus')
 
     @property
     def window_id(self) -> int:
@@ -411,7 +279,7 @@ class TrayIcon(GObject.Object):
     @icon.setter
     def icon(self, icon: Gio.Icon) -> None:
         self.__icon = icon
-        self.__interface.NewIcon.emit()
+        self.__schedule_signal('NewIcon')
 
     @property
     def overlay_icon(self) -> Gio.Icon:
@@ -420,7 +288,7 @@ class TrayIcon(GObject.Object):
     @overlay_icon.setter
     def overlay_icon(self, overlay_icon: Gio.Icon) -> None:
         self.__overlay_icon = overlay_icon
-        self.__interface.NewOverlayIcon.emit()
+        self.__schedule_signal('NewOverlayIcon')
 
     @property
     def attention_icon(self) -> Gio.Icon:
@@ -429,7 +297,7 @@ class TrayIcon(GObject.Object):
     @attention_icon.setter
     def attention_icon(self, attention_icon: Gio.Icon) -> None:
         self.__attention_icon = attention_icon
-        self.__interface.NewAttentionIcon.emit()
+        self.__schedule_signal('NewAttentionIcon')
 
     @property
     def tooltip(self) -> tuple[Gio.Icon | None, str, str] | None:
@@ -438,12 +306,110 @@ class TrayIcon(GObject.Object):
     @tooltip.setter
     def tooltip(self, tooltip: tuple[Gio.Icon | None, str, str] | None):
         self.__tooltip = tooltip
-        self.__interface.NewToolTip.emit()
+        self.__schedule_signal('NewToolTip')
 
     @property
     def item_is_menu(self) -> bool:
         return self.__item_is_menu
 
+    @property
+    def icon_cache_stats(self) -> dict[str, int]:
+        return self.__menu_proxy.icon_cache_stats
+
+    @property
+    def bus(self) -> MessageBus:
+        return self.__bus
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        icon_cache_stats = self.icon_cache_stats
+        metrics = {
+            'icons.lookups': icon_cache_stats['hits'] + icon_cache_stats['misses'],
+            'icons.hits': icon_cache_stats['hits'],
+            'icons.misses': icon_cache_stats['misses'],
+        }
+        metrics |= {f'dbusmenu.items_{name}': count for name, count in self.__menu_proxy.item_stats.items()}
+        for signal, counts in self.signal_stats.items():
+            metrics |= {f'sni.signals.{signal}.{name}': count for name, count in counts.items()}
+        return metrics
+
+    @property
+    def signal_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            signal: counts | {'suppressed': counts['requested'] - counts['emitted']}
+            for signal, counts in self.__signal_counts.items()
+        }
+
+    def __signal_value(self, signal: str):
+        match signal:
+            case 'NewTitle':
+                return self.__title
+            case 'NewStatus':
+                return self.__status
+            case 'NewIcon':
+                return self.__icon
+            case 'NewOverlayIcon':
+                return self.__overlay_icon
+            case 'NewAttentionIcon':
+                return self.__attention_icon
+            case 'NewToolTip':
+                return self.__tooltip
+
+    def __schedule_signal(self, signal: str) -> None:
+        self.__signal_counts[signal]['requested'] += 1
+        if self.__signal_scheduler.pending or not _same_value(self.__signal_value(signal), self.__emitted[signal]):
+            self.__signal_scheduler.schedule(signal)
+
+    def __emit_signals(self, signals: list[str]) -> None:
+        for signal in signals:
+            value = self.__signal_value(signal)
+            if _same_value(value, self.__emitted[signal]):
+                continue
+
+            self.__emitted[signal] = value
+            self.__signal_counts[signal]['emitted'] += 1
+            if signal == 'NewStatus':
+                self.__interface.NewStatus.emit(value.value)
+            else:
+                getattr(self.__interface, signal).emit()
+
+    def __register(self) -> None:
+        if self.__registration is not None:
+            self.__registration.cancel()
+        self.__registration = asyncio.get_event_loop().create_task(self.__register_with_backoff())
+
+    async def __register_with_backoff(self) -> None:
+        delay = _REGISTRATION_INITIAL_DELAY
+        while True:
+            try:
+                await self.__bus.connection.call_asyncio(
+                    self.__watcher.service_name,
+                    self.__watcher_object.object_path,
+                    self.__watcher.interface_name,
+                    'RegisterStatusNotifierItem',
+                    GLib.Variant('(s)', (self.__object_path,)),
+                    None,
+                    Gio.DBusCallFlags.NONE,
+                    _REGISTRATION_TIMEOUT_MS,
+                )
+                self.emit('registered')
+                return
+            except GLib.Error:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _REGISTRATION_MAX_DELAY)
+
+    def __on_watcher_owner_changed(self, _connection, _sender, _path, _interface, _signal, parameters) -> None:
+        _, _, new_owner = parameters.unpack()
+        if new_owner:
+            self.__register()
+        elif self.__registration is not None:
+            self.__registration.cancel()
+            self.__registration = None
+
+    @GObject.Signal('registered')
+    def registered(self) -> None:
+        pass
+
     @GObject.Signal('context-menu')
     def context_menu(self, x: int, y: int) -> None:
         pass
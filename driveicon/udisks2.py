@@ -0,0 +1,283 @@
+"""A volume monitor fed directly from the UDisks2 ObjectManager.
+
+One GetManagedObjects call builds an in-memory index of drives and block
+devices; InterfacesAdded, InterfacesRemoved and PropertiesChanged then update
+only the objects they name, and the monitor emits the usual Gio.VolumeMonitor
+signals for the devices that actually changed.
+"""
+
+import asyncio
+
+from gi.repository import GLib, Gio
+
+from .memorydevices import MemoryDrive, MemoryMount, MemoryVolume, MemoryVolumeMonitor
+
+
+UDISKS2_BUS_NAME = 'org.freedesktop.UDisks2'
+UDISKS2_OBJECT_PATH = '/org/freedesktop/UDisks2'
+
+_OBJECT_MANAGER = 'org.freedesktop.DBus.ObjectManager'
+_PROPERTIES = 'org.freedesktop.DBus.Properties'
+_DRIVE = 'org.freedesktop.UDisks2.Drive'
+_BLOCK = 'org.freedesktop.UDisks2.Block'
+_FILESYSTEM = 'org.freedesktop.UDisks2.Filesystem'
+
+_CALL_FLAGS = Gio.DBusCallFlags.ALLOW_INTERACTIVE_AUTHORIZATION
+
+
+def _bytestring(value) -> str:
+    return bytes(value).rstrip(b'\0').decode(errors='replace')
+
+
+class _UDisksCaller:
+    def __init__(self, connection: Gio.DBusConnection) -> None:
+        self.__connection = connection
+
+    def call(self, object_path: str, interface: str, method: str, parameters: GLib.Variant, *, timeout = None):
+        return self.__connection.call_asyncio(
+            UDISKS2_BUS_NAME,
+            object_path,
+            interface,
+            method,
+            parameters,
+            None,
+            _CALL_FLAGS,
+            -1,
+            timeout=timeout,
+        )
+
+    async def unmount(self, block_path: str, timeout) -> None:
+        await self.call(block_path, _FILESYSTEM, 'Unmount', GLib.Variant('(a{sv})', ({},)), timeout=timeout)
+
+    async def eject(self, drive: '_UDisksDrive', timeout) -> None:
+        for volume in drive.volumes:
+            if volume.mount is not None:
+                await self.unmount(volume.object_path, timeout)
+        await self.call(drive.object_path, _DRIVE, 'Eject', GLib.Variant('(a{sv})', ({},)), timeout=timeout)
+
+
+class _UDisksDrive(MemoryDrive):
+    def __init__(self, object_path: str, caller: _UDisksCaller) -> None:
+        super().__init__(object_path)
+        self.object_path = object_path
+        self.caller = caller
+
+    def eject_with_operation_asyncio(self, _flags, _mount_operation, *, timeout = None) -> asyncio.Future:
+        return asyncio.ensure_future(self.caller.eject(self, timeout))
+
+
+class _UDisksVolume(MemoryVolume):
+    def __init__(self, object_path: str, caller: _UDisksCaller) -> None:
+        super().__init__(object_path)
+        self.object_path = object_path
+        self.caller = caller
+        self.block_drive = '/'
+
+    def mount_asyncio(self, _flags, _mount_operation, *, timeout = None) -> asyncio.Future:
+        return self.caller.call(
+            self.object_path,
+            _FILESYSTEM,
+            'Mount',
+            GLib.Variant('(a{sv})', ({},)),
+            timeout=timeout,
+        )
+
+    def eject_with_operation_asyncio(self, _flags, _mount_operation, *, timeout = None) -> asyncio.Future:
+        return asyncio.ensure_future(self.caller.eject(self.drive, timeout))
+
+
+class _UDisksMount(MemoryMount):
+    def unmount_with_operation_asyncio(self, _flags, _mount_operation, *, timeout = None) -> asyncio.Future:
+        return asyncio.ensure_future(self.volume.caller.unmount(self.volume.object_path, timeout))
+
+    def eject_with_operation_asyncio(self, _flags, _mount_operation, *, timeout = None) -> asyncio.Future:
+        return asyncio.ensure_future(self.volume.caller.eject(self.volume.drive, timeout))
+
+
+class UDisks2VolumeMonitor(MemoryVolumeMonitor):
+    """Mirrors UDisks2 drives and filesystems as Gio drives, volumes and mounts.
+
+    Only drives and filesystems that are not hidden or system devices are
+    shown. Mount, unmount and eject go straight to UDisks2 through the
+    `*_asyncio` methods MountMenu calls.
+    """
+
+    def __init__(self, connection: Gio.DBusConnection | None = None) -> None:
+        super().__init__()
+        self.__connection = connection or Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        self.__caller = _UDisksCaller(self.__connection)
+        self.__objects: dict[str, dict[str, dict]] = {}
+        self.__drives: dict[str, _UDisksDrive] = {}
+        self.__volumes: dict[str, _UDisksVolume] = {}
+
+        self.__connection.signal_subscribe(
+            UDISKS2_BUS_NAME,
+            _OBJECT_MANAGER,
+            None,
+            UDISKS2_OBJECT_PATH,
+            None,
+            Gio.DBusSignalFlags.NONE,
+            self.__on_object_manager_signal,
+        )
+        self.__connection.signal_subscribe(
+            UDISKS2_BUS_NAME,
+            _PROPERTIES,
+            'PropertiesChanged',
+            None,
+            None,
+            Gio.DBusSignalFlags.NONE,
+            self.__on_properties_changed,
+        )
+        self.ready = self.__caller.call(
+            UDISKS2_OBJECT_PATH,
+            _OBJECT_MANAGER,
+            'GetManagedObjects',
+            None,
+        )
+        self.ready.add_done_callback(self.__on_managed_objects)
+
+    def __on_managed_objects(self, future: asyncio.Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        objects, = future.result().unpack()
+        for object_path, interfaces in objects.items():
+            self.__objects.setdefault(object_path, {}).update(interfaces)
+        for object_path in sorted(objects, key=lambda path: _DRIVE not in objects[path]):
+            self.__sync(object_path)
+
+    def __on_object_manager_signal(self, _connection, _sender, _path, _interface, signal, parameters) -> None:
+        match signal:
+            case 'InterfacesAdded':
+                object_path, interfaces = parameters.unpack()
+                self.__objects.setdefault(object_path, {}).update(interfaces)
+            case 'InterfacesRemoved':
+                object_path, interfaces = parameters.unpack()
+                if (entry := self.__objects.get(object_path)) is not None:
+                    for interface in interfaces:
+                        entry.pop(interface, None)
+                    if not entry:
+                        del self.__objects[object_path]
+            case _:
+                return
+        self.__sync(object_path)
+
+    def __on_properties_changed(self, _connection, _sender, object_path, _interface, _signal, parameters) -> None:
+        interface, changed, invalidated = parameters.unpack()
+        if (properties := self.__objects.get(object_path, {}).get(interface)) is None:
+            return
+
+        properties.update(changed)
+        for name in invalidated:
+            properties.pop(name, None)
+        self.__sync(object_path)
+
+    def __sync(self, object_path: str) -> None:
+        interfaces = self.__objects.get(object_path, {})
+        if object_path in self.__drives or _DRIVE in interfaces:
+            self.__sync_drive(object_path, interfaces.get(_DRIVE))
+        if object_path in self.__volumes or _BLOCK in interfaces:
+            self.__sync_volume(object_path, interfaces.get(_BLOCK), interfaces.get(_FILESYSTEM))
+
+    def __sync_drive(self, object_path: str, properties: dict | None) -> None:
+        drive = self.__drives.get(object_path)
+        if properties is None:
+            if drive is not None:
+                del self.__drives[object_path]
+                self.standalone_volumes += drive.volumes
+                for volume in drive.volumes:
+                    volume.drive = None
+                drive.volumes = []
+                self.disconnect_drive(drive)
+            return
+
+        created = drive is None
+        if created:
+            drive = self.__drives[object_path] = _UDisksDrive(object_path, self.__caller)
+
+        name = ' '.join(filter(None, (properties.get('Vendor', '').strip(), properties.get('Model', '').strip())))
+        drive.name = name or properties.get('Id', '') or object_path.rsplit('/', 1)[-1]
+        drive.removable = properties.get('Removable', False) or properties.get('MediaRemovable', False)
+        drive.ejectable = properties.get('Ejectable', False)
+        drive.icon = 'drive-removable-media' if drive.removable else 'drive-harddisk'
+        drive.identifier = properties.get('Id') or None
+
+        if not created:
+            self.changed(drive)
+            return
+
+        for volume in list(self.standalone_volumes):
+            if volume.block_drive == object_path:
+                self.standalone_volumes.remove(volume)
+                drive.add_volume(volume)
+        self.connect_drive(drive)
+
+    def __sync_volume(self, object_path: str, block: dict | None, filesystem: dict | None) -> None:
+        volume = self.__volumes.get(object_path)
+        visible = (
+            block is not None
+            and filesystem is not None
+            and not block.get('HintIgnore', False)
+            and not block.get('HintSystem', False)
+        )
+        if not visible:
+            if volume is not None:
+                self.__remove_volume(object_path, volume)
+            return
+
+        created = volume is None
+        if created:
+            volume = self.__volumes[object_path] = _UDisksVolume(object_path, self.__caller)
+
+        volume.block_drive = block.get('Drive', '/')
+        volume.uuid = block.get('IdUUID') or None
+        volume.identifier = _bytestring(block.get('PreferredDevice') or block.get('Device', b'')) or None
+        size = block.get('Size', 0)
+        volume.name = block.get('HintName') or block.get('IdLabel') or f'{GLib.format_size(size)} Volume'
+        volume.icon = block.get('HintIconName') or 'drive-harddisk'
+        drive = self.__drives.get(volume.block_drive)
+        volume.ejectable = drive is not None and drive.ejectable
+
+        mount_points = [_bytestring(point) for point in filesystem.get('MountPoints', [])]
+        mount = volume.mount
+        if created:
+            if drive is not None:
+                drive.add_volume(volume)
+                self.emit('volume-added', volume)
+            else:
+                self.add_volume(volume)
+        if mount_points and mount is None:
+            mount = _UDisksMount(volume.name, Gio.File.new_for_path(mount_points[0]), uuid=volume.uuid)
+            self.__update_mount(mount, volume, mount_points[0])
+            self.mount_volume(volume, mount)
+        elif not mount_points and mount is not None:
+            self.unmount_volume(volume)
+        else:
+            if mount is not None:
+                self.__update_mount(mount, volume, mount_points[0])
+                self.changed(mount)
+            if not created:
+                self.changed(volume)
+
+    @staticmethod
+    def __update_mount(mount: _UDisksMount, volume: _UDisksVolume, mount_point: str) -> None:
+        mount.name = volume.name
+        mount.icon = volume.icon
+        mount.uuid = volume.uuid
+        mount.root = Gio.File.new_for_path(mount_point)
+        mount.ejectable = volume.ejectable
+
+    def __remove_volume(self, object_path: str, volume: _UDisksVolume) -> None:
+        del self.__volumes[object_path]
+        if volume.mount is not None:
+            mount = volume.mount
+            volume.set_mount(None)
+            self.emit('mount-removed', mount)
+
+        if volume in self.standalone_volumes:
+            self.remove_volume(volume)
+            return
+
+        if volume.drive is not None:
+            volume.drive.volumes.remove(volume)
+        self.emit('volume-removed', volume)
@@ -0,0 +1,263 @@
+"""A minimal stand-in for the UDisks2 service, for exercising UDisks2VolumeMonitor.
+
+It exports the ObjectManager and the Drive, Block and Filesystem interfaces
+with the handful of properties and methods the backend uses, on whatever bus
+it is given. Run as a module, it starts a private bus, publishes a few drives,
+walks a MountMenu through a mount and a hotplug, and fails if the menu does not
+show what each step should have left in it:
+
+    python -m driveicon.udisksstandin
+"""
+
+from gi.repository import GLib, Gio
+
+from .udisks2 import UDISKS2_BUS_NAME, UDISKS2_OBJECT_PATH
+
+
+_INTROSPECTION = Gio.DBusNodeInfo.new_for_xml('''
+<node>
+  <interface name="org.freedesktop.DBus.ObjectManager">
+    <method name="GetManagedObjects">
+      <arg type="a{oa{sa{sv}}}" direction="out"/>
+    </method>
+    <signal name="InterfacesAdded">
+      <arg type="o"/>
+      <arg type="a{sa{sv}}"/>
+    </signal>
+    <signal name="InterfacesRemoved">
+      <arg type="o"/>
+      <arg type="as"/>
+    </signal>
+  </interface>
+  <interface name="org.freedesktop.UDisks2.Drive">
+    <method name="Eject">
+      <arg type="a{sv}" direction="in"/>
+    </method>
+  </interface>
+  <interface name="org.freedesktop.UDisks2.Block"/>
+  <interface name="org.freedesktop.UDisks2.Filesystem">
+    <method name="Mount">
+      <arg type="a{sv}" direction="in"/>
+      <arg type="s" direction="out"/>
+    </method>
+    <method name="Unmount">
+      <arg type="a{sv}" direction="in"/>
+    </method>
+  </interface>
+</node>
+''')
+
+_DRIVE = 'org.freedesktop.UDisks2.Drive'
+_BLOCK = 'org.freedesktop.UDisks2.Block'
+_FILESYSTEM = 'org.freedesktop.UDisks2.Filesystem'
+
+
+class UDisks2StandIn:
+    def __init__(self, connection: Gio.DBusConnection, mount_root = '/run/media/standin') -> None:
+        self.__connection = connection
+        self.__mount_root = mount_root
+        self.__objects: dict[str, dict[str, dict[str, GLib.Variant]]] = {}
+        self.__registrations: dict[str, list[int]] = {}
+        self.__next_id = 0
+
+        connection.register_object(
+            UDISKS2_OBJECT_PATH,
+            _INTROSPECTION.lookup_interface('org.freedesktop.DBus.ObjectManager'),
+            self.__on_method_call,
+        )
+        self.__owner_id = Gio.bus_own_name_on_connection(
+            connection,
+            UDISKS2_BUS_NAME,
+            Gio.BusNameOwnerFlags.NONE,
+            None,
+            None,
+        )
+
+    def add_drive(self, vendor: str, model: str, *, removable = True, ejectable = True) -> str:
+        object_path = f'{UDISKS2_OBJECT_PATH}/drives/{self.__new_id(model)}'
+        self.__add_object(object_path, {_DRIVE: {
+            'Vendor': GLib.Variant('s', vendor),
+            'Model': GLib.Variant('s', model),
+            'Id': GLib.Variant('s', object_path.rsplit('/', 1)[-1]),
+            'Removable': GLib.Variant('b', removable),
+            'MediaRemovable': GLib.Variant('b', removable),
+            'Ejectable': GLib.Variant('b', ejectable),
+        }})
+        return object_path
+
+    def add_filesystem(self, drive_path: str, label: str, *, uuid: str, size = 8 * 1024 ** 3) -> str:
+        block_name = self.__new_id('sd')
+        object_path = f'{UDISKS2_OBJECT_PATH}/block_devices/{block_name}'
+        self.__add_object(object_path, {
+            _BLOCK: {
+                'Drive': GLib.Variant('o', drive_path),
+                'Device': GLib.Variant('ay', f'/dev/{block_name}'.encode() + b'\0'),
+                'PreferredDevice': GLib.Variant('ay', f'/dev/{block_name}'.encode() + b'\0'),
+                'IdUUID': GLib.Variant('s', uuid),
+                'IdLabel': GLib.Variant('s', label),
+                'Size': GLib.Variant('t', size),
+                'HintIgnore': GLib.Variant('b', False),
+                'HintSystem': GLib.Variant('b', False),
+                'HintName': GLib.Variant('s', ''),
+                'HintIconName': GLib.Variant('s', ''),
+            },
+            _FILESYSTEM: {
+                'MountPoints': GLib.Variant('aay', []),
+            },
+        })
+        return object_path
+
+    def remove_object(self, object_path: str) -> None:
+        for registration_id in self.__registrations.pop(object_path, []):
+            self.__connection.unregister_object(registration_id)
+        interfaces = self.__objects.pop(object_path)
+        self.__emit(UDISKS2_OBJECT_PATH, 'org.freedesktop.DBus.ObjectManager', 'InterfacesRemoved', GLib.Variant(
+            '(oas)',
+            (object_path, list(interfaces)),
+        ))
+
+    def set_mount_point(self, block_path: str, mount_point: str | None) -> None:
+        points = [mount_point.encode() + b'\0'] if mount_point is not None else []
+        value = GLib.Variant('aay', points)
+        self.__objects[block_path][_FILESYSTEM]['MountPoints'] = value
+        self.__emit(block_path, 'org.freedesktop.DBus.Properties', 'PropertiesChanged', GLib.Variant(
+            '(sa{sv}as)',
+            (_FILESYSTEM, {'MountPoints': value}, []),
+        ))
+
+    def __new_id(self, prefix: str) -> str:
+        self.__next_id += 1
+        return f'{prefix.replace(" ", "_")}{self.__next_id}'
+
+    def __add_object(self, object_path: str, interfaces: dict[str, dict[str, GLib.Variant]]) -> None:
+        self.__objects[object_path] = interfaces
+        self.__registrations[object_path] = [
+            self.__connection.register_object(
+                object_path,
+                _INTROSPECTION.lookup_interface(interface),
+                self.__on_method_call,
+            )
+            for interface in interfaces
+        ]
+        self.__emit(UDISKS2_OBJECT_PATH, 'org.freedesktop.DBus.ObjectManager', 'InterfacesAdded', GLib.Variant(
+            '(oa{sa{sv}})',
+            (object_path, interfaces),
+        ))
+
+    def __emit(self, object_path: str, interface: str, signal: str, parameters: GLib.Variant) -> None:
+        self.__connection.emit_signal(None, object_path, interface, signal, parameters)
+
+    def __on_method_call(self, _connection, _sender, object_path, _interface, method, _parameters, invocation):
+        match method:
+            case 'GetManagedObjects':
+                invocation.return_value(GLib.Variant('(a{oa{sa{sv}}})', (self.__objects,)))
+            case 'Mount':
+                label = self.__objects[object_path][_BLOCK]['IdLabel'].unpack()
+                mount_point = f'{self.__mount_root}/{label}'
+                self.set_mount_point(object_path, mount_point)
+                invocation.return_value(GLib.Variant('(s)', (mount_point,)))
+            case 'Unmount':
+                self.set_mount_point(object_path, None)
+                invocation.return_value(None)
+            case 'Eject':
+                blocks = [
+                    path for path, interfaces in self.__objects.items()
+                    if _BLOCK in interfaces and interfaces[_BLOCK]['Drive'].unpack() == object_path
+                ]
+                if any(self.__objects[path][_FILESYSTEM]['MountPoints'].unpack() for path in blocks):
+                    invocation.return_dbus_error('org.freedesktop.UDisks2.Error.DeviceBusy', 'Device is mounted')
+                    return
+                for path in blocks:
+                    self.remove_object(path)
+                self.remove_object(object_path)
+                invocation.return_value(None)
+
+
+def _menu_labels(menu: Gio.MenuModel, depth = 0) -> list[str]:
+    labels = []
+    for i in range(menu.get_n_items()):
+        label = menu.get_item_attribute_value(i, Gio.MENU_ATTRIBUTE_LABEL, GLib.VariantType.new('s'))
+        if label is not None:
+            labels.append('  ' * depth + label.get_string())
+        for link in (Gio.MENU_LINK_SUBMENU, Gio.MENU_LINK_SECTION):
+            if (child := menu.get_item_link(i, link)) is not None:
+                labels += _menu_labels(child, depth + 1)
+    return labels
+
+
+def _has_label(labels: list[str], text: str) -> bool:
+    return any(text in label for label in labels)
+
+
+def _device_actions(action_group: Gio.ActionGroup, verb: str) -> list[str]:
+    return [
+        name for name in action_group.list_actions()
+        if name.startswith(f'{verb}-') and name != f'{verb}-all'
+    ]
+
+
+def main() -> None:
+    import asyncio
+
+    from gi.events import GLibEventLoopPolicy
+
+    from . import wrappers
+    from .mountmenu import MountMenu
+    from .udisks2 import UDisks2VolumeMonitor
+
+    asyncio.set_event_loop_policy(GLibEventLoopPolicy())
+    wrappers.wrap_all()
+
+    test_dbus = Gio.TestDBus.new(Gio.TestDBusFlags.NONE)
+    test_dbus.up()
+    try:
+        def connect():
+            return Gio.DBusConnection.new_for_address_sync(
+                test_dbus.get_bus_address(),
+                Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+                None,
+                None,
+            )
+
+        standin = UDisks2StandIn(connect())
+        for i in range(3):
+            drive = standin.add_drive('Acme', f'Stick {i}')
+            standin.add_filesystem(drive, f'STICK{i}', uuid=f'0000-000{i}')
+
+        async def walk():
+            monitor = UDisks2VolumeMonitor(connect())
+            mount_menu = MountMenu(
+                volume_monitor=monitor,
+                volume_monitor_ready=monitor.ready,
+                filesystem_info_ttl=3600,
+            )
+            await monitor.ready
+            await asyncio.sleep(0.5)
+            labels = _menu_labels(mount_menu.menu)
+            print('\n'.join(labels), end='\n\n')
+            for i in range(3):
+                assert _has_label(labels, f'STICK{i}'), f'STICK{i} is missing from the menu'
+
+            mount_actions = _device_actions(mount_menu.action_group, 'mount')
+            assert mount_actions, 'no stick can be mounted'
+            mount_action = mount_actions[0]
+            mount_menu.action_group.activate_action(mount_action, None)
+            await asyncio.sleep(0.5)
+            print('\n'.join(_menu_labels(mount_menu.menu)), end='\n\n')
+            assert not mount_menu.action_group.has_action(mount_action), 'the mounted stick can still be mounted'
+            assert len(_device_actions(mount_menu.action_group, 'unmount')) == 1, 'the mounted stick cannot be unmounted'
+
+            drive = standin.add_drive('Acme', 'Hotplugged')
+            standin.add_filesystem(drive, 'HOTPLUG', uuid='0000-0100')
+            await asyncio.sleep(0.5)
+            labels = _menu_labels(mount_menu.menu)
+            print('\n'.join(labels))
+            assert _has_label(labels, 'HOTPLUG'), 'the hotplugged stick is missing from the menu'
+
+        asyncio.get_event_loop().run_until_complete(walk())
+    finally:
+        test_dbus.down()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Virtual devices for driving MountMenu without real hardware.
+
+The benchmarks and trace replay create and change these by hand.
+"""
+
+from gi.repository import Gio
+
+from .memorydevices import MemoryDrive, MemoryMount, MemoryVolume, MemoryVolumeMonitor
+
+
+class VirtualDrive(MemoryDrive):
+    pass
+
+
+class VirtualVolume(MemoryVolume):
+    pass
+
+
+class VirtualMount(MemoryMount):
+    def set_shadowed(self, shadowed: bool) -> None:
+        if shadowed and not self.is_shadowed():
+            self.shadow()
+        while not shadowed and self.is_shadowed():
+            self.unshadow()
+
+
+class VirtualVolumeMonitor(MemoryVolumeMonitor):
+    """Stands in for `Gio.VolumeMonitor.get()` where there is no real hardware."""
+
+    def add_mount(self, mount: VirtualMount) -> None:
+        self.standalone_mounts.append(mount)
+        self.emit('mount-added', mount)
+
+    def remove_mount(self, mount: VirtualMount) -> None:
+        self.standalone_mounts.remove(mount)
+        self.emit('mount-removed', mount)
+
+
+def populate(
+        monitor: VirtualVolumeMonitor,
+        drives: int,
+        volumes_per_drive: int,
+        mounts_per_drive: int,
+) -> None:
+    """Connects `drives` removable drives with `volumes_per_drive` volumes each.
+
+    The first `mounts_per_drive` volumes of every drive are mounted.
+    """
+    for i in range(drives):
+        drive = VirtualDrive(f'Drive {i}', identifier=f'/dev/vd{i}')
+        for j in range(volumes_per_drive):
+            volume = VirtualVolume(f'Volume {i}.{j}', uuid=f'{i:08x}-{j:04x}', identifier=f'/dev/vd{i}p{j}')
+            if j < mounts_per_drive:
+                root = Gio.File.new_for_path(f'/run/driveicon-virtual/{i}/{j}')
+                volume.set_mount(VirtualMount(f'Volume {i}.{j}', root, uuid=volume.uuid))
+            drive.add_volume(volume)
+        monitor.connect_drive(drive)
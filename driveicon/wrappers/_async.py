@@ -1,23 +1,22 @@
 import asyncio
-from typing import Iterable
+from typing import Callable
 from functools import partialmethod, partial
 
 from gi.repository import GLib, Gio, GObject
 
 
-def _find_async_methods_with_async_suffix(cls) -> Iterable[tuple[str, str, str]]:
-    for begin_method in filter(lambda n: n.endswith('_async'), dir(cls)):
-        prefix = begin_method[:-6]
-        finish_method = prefix + '_finish'
-        if hasattr(cls, finish_method):
-            yield begin_method, finish_method, prefix + '_asyncio'
+def _find_async_method_with_async_suffix(cls, prefix: str) -> tuple[str, str, str] | None:
+    begin_method, finish_method = prefix + '_async', prefix + '_finish'
+    if hasattr(cls, begin_method) and hasattr(cls, finish_method):
+        return begin_method, finish_method, prefix + '_asyncio'
+    return None
 
 
-def _find_async_methods_with_finish_suffix(cls) -> Iterable[tuple[str, str, str]]:
-    for finish_method in filter(lambda n: n.endswith('_finish'), dir(cls)):
-        begin_method = finish_method[:-7]
-        if hasattr(cls, begin_method):
-            yield begin_method, finish_method, begin_method + '_asyncio'
+def _find_async_method_with_finish_suffix(cls, prefix: str) -> tuple[str, str, str] | None:
+    begin_method, finish_method = prefix, prefix + '_finish'
+    if hasattr(cls, begin_method) and hasattr(cls, finish_method):
+        return begin_method, finish_method, prefix + '_asyncio'
+    return None
 
 
 def _wrap_gio(target, begin_method: str, finish_method: str, wrapped_method: str, default_params = None):
@@ -33,12 +32,20 @@ def _wrap_gio(target, begin_method: str, finish_method: str, wrapped_method: str
             self.__async_finish = async_finish
             self.__default_params = default_params
 
-        def __call__(self, *args, **kwargs) -> asyncio.Future:
-            future = asyncio.get_event_loop().create_future()
-            async_begin(
+        def __call__(self, *args, timeout: float | None = None, **kwargs) -> asyncio.Future:
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            cancellable = kwargs.pop('cancellable', None) or Gio.Cancellable()
+            future.add_done_callback(partial(self.__cancel_callback, cancellable))
+
+            if timeout is not None:
+                timer = loop.call_later(timeout, self.__timeout_callback, future, cancellable, timeout)
+                future.add_done_callback(lambda _: timer.cancel())
+
+            self.__async_begin(
                 *args,
-                **(default_params | kwargs),
-                cancellable=None,
+                **(self.__default_params | kwargs),
+                cancellable=cancellable,
                 callback=partial(self.__finish_callback, future),
             )
 
@@ -47,17 +54,41 @@ def _wrap_gio(target, begin_method: str, finish_method: str, wrapped_method: str
         def __finish_callback(self, future: asyncio.Future, obj: GObject.Object, result: Gio.AsyncResult):
             try:
                 ret = self.__async_finish(obj, result)
-                future.set_result(ret)
             except Exception as e:
-                future.set_exception(e)
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(ret)
+
+        @staticmethod
+        def __cancel_callback(cancellable: Gio.Cancellable, future: asyncio.Future):
+            if future.cancelled():
+                cancellable.cancel()
+
+        @staticmethod
+        def __timeout_callback(future: asyncio.Future, cancellable: Gio.Cancellable, timeout: float):
+            if not future.done():
+                future.set_exception(TimeoutError(f'operation did not finish within {timeout} seconds'))
+                cancellable.cancel()
 
     wrapper = Wrapper(async_begin, async_finish, default_params)
     setattr(target, wrapped_method, partialmethod(wrapper))
 
 
+def _wrap_lazily(cls, find_method: Callable[[type, str], tuple[str, str, str] | None], default_params: dict):
+    def __getattr__(self, name: str):
+        if name.endswith('_asyncio') and (method_spec := find_method(cls, name[:-8])) is not None:
+            _wrap_gio(cls, *method_spec, default_params)
+            return getattr(self, name)
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+    setattr(cls, '__getattr__', __getattr__)
+
+
 def _wrap_async():
-    classes_with_async_suffix = [Gio.File, Gio.FileEnumerator]
-    classes_with_finish_suffix = [Gio.Drive, Gio.Volume, Gio.Mount]
+    classes_with_async_suffix = [Gio.File, Gio.FileEnumerator, Gio.AppInfo]
+    classes_with_finish_suffix = [Gio.Drive, Gio.Volume, Gio.Mount, Gio.DBusConnection]
 
     io_priority_param = ('io_priority', GLib.PRIORITY_DEFAULT)
     class_extra_params = {
@@ -66,10 +97,8 @@ def _wrap_async():
     }
 
     class_lists = [classes_with_async_suffix, classes_with_finish_suffix]
-    find_method_lists = [_find_async_methods_with_async_suffix, _find_async_methods_with_finish_suffix]
+    find_method_lists = [_find_async_method_with_async_suffix, _find_async_method_with_finish_suffix]
 
     for class_list, find_method in zip(class_lists, find_method_lists):
         for cls in class_list:
-            extra_params = class_extra_params.get(cls, {})
-            for method_spec in find_method(cls):
-                _wrap_gio(cls, *method_spec, extra_params)
+            _wrap_lazily(cls, find_method, class_extra_params.get(cls, {}))